@@ -36,6 +36,7 @@ modules = developer_utils.setup_addon_modules(__path__, __name__, "bpy" in local
 from . general_panel import register_general_panel, unregister_general_panel
 from . custom_panel import register_custom_panel, unregister_custom_panel
 from . small_scenery_panel import register_small_scenery_panel, unregister_small_scenery_panel
+from . large_scenery_panel import register_large_scenery_panel, unregister_large_scenery_panel
 from . vehicles_panel import register_vehicles_panel, unregister_vehicles_panel
 from . stall_panel import register_stall_panel, unregister_stall_panel
 
@@ -52,6 +53,7 @@ def register():
     register_general_panel()
     register_custom_panel()
     register_small_scenery_panel()
+    register_large_scenery_panel()
     register_vehicles_panel()
     register_stall_panel()
 
@@ -68,6 +70,7 @@ def unregister():
     unregister_general_panel()
     unregister_custom_panel()
     unregister_small_scenery_panel()
+    unregister_large_scenery_panel()
     unregister_vehicles_panel()
 
     print("Unregistered {}".format(bl_info["name"]))
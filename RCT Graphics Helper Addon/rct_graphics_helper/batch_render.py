@@ -0,0 +1,206 @@
+'''
+Copyright (c) 2021 RCT Graphics Helper developers
+
+For a complete list of all authors, please refer to the addon's meta info.
+Interested in contributing? Visit https://github.com/oli414/Blender-RCT-Graphics
+
+RCT Graphics Helper is licensed under the GNU General Public License version 3.
+'''
+
+# Renders an RCT object without Blender's UI
+#
+# Run it with Blender in background mode, with this script's own arguments
+# after a `--`:
+#
+#     blender -b --python batch_render.py -- object.blend small_scenery output/
+#
+# Add `--workers N` to split the images between N background Blender processes,
+# which are merged back together into the same output as a normal render.
+#
+# The exit status is 0 if the object was rendered, 1 if rendering failed, and 2
+# if the arguments were wrong.
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import traceback
+
+import bpy
+
+
+render_operators = {
+    "custom": "rct_custom",
+    "small_scenery": "rct_small_scenery",
+    "large_scenery": "rct_large_scenery",
+    "stall": "rct_stall",
+    "vehicle": "rct_vehicle",
+}
+"""The render operator (in `bpy.ops.render`) for each object type."""
+
+
+def parse_args(argv):
+    """Parses the arguments that come after `--` on Blender's command line
+
+    Args:
+        argv (list[str]): Blender's full command line (`sys.argv`)
+
+    Returns:
+        argparse.Namespace: The parsed arguments
+    """
+    argv = argv[argv.index("--") + 1:] if "--" in argv else []
+    parser = argparse.ArgumentParser(
+        prog="blender -b --python batch_render.py --",
+        description="Renders an RCT object from a .blend file without Blender's UI.")
+    parser.add_argument("blend", help="The .blend file to render")
+    parser.add_argument("type", choices=sorted(render_operators.keys()), help="The type of object to render")
+    parser.add_argument("output", help="The folder to write the images, object.json and parkobj to")
+    parser.add_argument("--metadata-only", action="store_true",
+                        help="Only rebuild object.json and the parkobj, reusing the images from the last render")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="The number of background Blender processes to split the rendering between")
+    parser.add_argument("--shard", type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--cache", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.workers < 1 or (args.shard is not None and not 0 <= args.shard < args.workers):
+        parser.error("--workers has to be at least 1, and --shard has to be below it")
+    return args
+
+
+def enable_addon():
+    """Enables the RCT Graphics Helper Add-on, and returns its package"""
+    import addon_utils
+    addon_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    if addon_dir not in sys.path:
+        sys.path.append(addon_dir)
+    addon_utils.enable("rct_graphics_helper", default_set=True)
+    import rct_graphics_helper
+    return rct_graphics_helper
+
+
+def start_shards(args):
+    """Starts a background Blender process for each shard of the render
+
+    Returns:
+        list[tuple[str, subprocess.Popen]]: The output folder and process of
+            each shard
+    """
+    shards = []
+    for shard in range(args.workers):
+        shard_dir = os.path.join(os.path.abspath(args.output), "shards", str(shard))
+        command = [bpy.app.binary_path, "-b", "--python", os.path.realpath(__file__), "--",
+                   os.path.abspath(args.blend), args.type, shard_dir,
+                   "--workers", str(args.workers), "--shard", str(shard),
+                   "--cache", os.path.join(os.path.abspath(args.output), "cache")]
+        shards.append((shard_dir, subprocess.Popen(command)))
+    return shards
+
+
+def merge_shards(addon, shard_dirs):
+    """Moves the shards' images into the output folder, and merges their object.json files
+
+    Args:
+        addon (module): The RCT Graphics Helper package
+        shard_dirs (list[str]): The output folder of each shard
+
+    Returns:
+        dict: The merged JSON data, with every shard's images in order
+    """
+    merged = None
+    for shard_dir in shard_dirs:
+        shard_data = addon.json_functions.read_json_file(os.path.join(shard_dir, "object.json"))
+        if merged is None:
+            merged = dict(shard_data)
+            merged["images"] = []
+        # Each shard only fills in its own images, and leaves the rest as null
+        merged_images = merged["images"]
+        for position, image in enumerate(shard_data.get("images", [])):
+            if image is None:
+                continue
+            merged_images.extend([None] * (position + 1 - len(merged_images)))
+            merged_images[position] = image
+        for folder in ("images", "preview"):
+            shard_folder = os.path.join(shard_dir, folder)
+            if not os.path.exists(shard_folder):
+                continue
+            os.makedirs(addon.render_task.get_output_path(folder), exist_ok=True)
+            for name in os.listdir(shard_folder):
+                os.replace(os.path.join(shard_folder, name), addon.render_task.get_output_path(folder + "/" + name))
+    return merged
+
+
+def render_with_workers(args, addon):
+    """Renders the object by splitting it between `args.workers` background Blender processes
+
+    Returns:
+        int: The exit status
+    """
+    for folder in ("shards", "images", "preview"):
+        if os.path.exists(addon.render_task.get_output_path(folder)):
+            shutil.rmtree(addon.render_task.get_output_path(folder))
+    shards = start_shards(args)
+    failed = [shard for shard, (_, process) in enumerate(shards) if process.wait() != 0]
+    if failed:
+        print("Rendering failed in shard(s) %s" % ", ".join(str(shard) for shard in failed))
+        return 1
+
+    merged = merge_shards(addon, [shard_dir for shard_dir, _ in shards])
+    addon.json_functions.json_data.clear()
+    addon.json_functions.json_data.update(merged)
+    addon.json_functions.make_parkobj(bpy.context)
+    shutil.rmtree(addon.render_task.get_output_path("shards"))
+    general_properties = bpy.context.scene.rct_graphics_helper_general_properties
+    if general_properties.use_render_cache:
+        # Shards don't prune the cache they share, so it's done once they're all finished
+        addon.render_cache.RenderCache(addon.render_task.get_cache_directory()).prune(
+            general_properties.render_cache_size * 1024 * 1024)
+    return 0
+
+
+def main(argv):
+    """Renders the object described by the command line
+
+    Returns:
+        int: The exit status
+    """
+    if not bpy.app.background:
+        print("batch_render.py has to be run with Blender in background mode (-b)")
+        return 2
+    try:
+        args = parse_args(argv)
+    except SystemExit as e:
+        return e.code
+
+    try:
+        bpy.ops.wm.open_mainfile(filepath=os.path.abspath(args.blend))
+        addon = enable_addon()
+        addon.render_task.set_output_directory(os.path.abspath(args.output))
+        if args.metadata_only:
+            warning = addon.general_panel.rebuild_metadata(bpy.context)
+            if warning:
+                print(warning)
+                return 1
+            print("Rebuilt metadata for %s into %s" % (args.blend, args.output))
+            return 0
+        if args.shard is None and args.workers > 1:
+            return render_with_workers(args, addon)
+        if args.shard is not None:
+            addon.render_task.set_shard(args.shard, args.workers)
+        if args.cache is not None:
+            # Shards all share the coordinator's cache
+            addon.render_task.set_cache_directory(args.cache)
+        operator = getattr(bpy.ops.render, render_operators[args.type])
+        result = operator()
+    except Exception:
+        traceback.print_exc()
+        return 1
+    if "FINISHED" not in result:
+        print("Rendering %s as %s did not finish: %s" % (args.blend, args.type, result))
+        return 1
+    print("Rendered %s as %s into %s" % (args.blend, args.type, args.output))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -54,13 +54,15 @@ class RenderCustom(RCTRender, bpy.types.Operator):
         scene_layers = [i for i in range(20) if self.scene.layers[i]]
 
         self.renderTask.add(angles, remap, "Normal", scene_layers, self.custom_properties.frameStart,
-                            self.custom_properties.num_frames)
+                            self.custom_properties.num_frames,
+                            symmetry=custom_properties.symmetry_degrees[self.custom_properties.symmetry])
         return super().execute(context)
 
     def finished(self, context):
         
         super().finished(context)
-        self.report({'INFO'}, 'RCT Custom render finished.')
+        if not self.failed:
+            self.report({'INFO'}, 'RCT Custom render finished.')
 
 
 class CustomProperties(bpy.types.PropertyGroup):
@@ -76,6 +78,7 @@ class CustomProperties(bpy.types.PropertyGroup):
         "90 degrees to each other. Otherwise, the angles span 360 degrees",
         default=4, min=1
     )
+    symmetry = custom_properties.symmetry
     hasPrimaryColour = custom_properties.hasPrimaryColour
     hasSecondaryColour = custom_properties.hasSecondaryColour
     hasTernaryColour = custom_properties.hasTernaryColour
@@ -126,6 +129,8 @@ class CustomPanel(bpy.types.Panel):
         row.prop(custom_properties, "image_index")
         row.prop(custom_properties, "num_angles")
         row = layout.row()
+        row.prop(custom_properties, "symmetry")
+        row = layout.row()
         row.prop(custom_properties, "hasPrimaryColour")
         row.prop(custom_properties, "hasSecondaryColour")
         row.prop(custom_properties, "hasTernaryColour")
@@ -215,6 +215,20 @@ hasTernaryColour = bpy.props.BoolProperty(
     update=update_colors,
     default=False)
 
+symmetry = bpy.props.EnumProperty(
+    name="Symmetry",
+    description=(
+        "How the object looks when turned around. Angles that look the same are only rendered once, and the image "
+        "is reused for the others. Leave this at None if the object's shading isn't symmetric too"),
+    default="none",
+    items=[
+        ("none", "None", "Every angle is rendered"),
+        ("half_turn", "Half Turn", "The object looks the same when turned 180 degrees"),
+        ("quarter_turn", "Quarter Turn", "The object looks the same when turned 90 degrees")])
+
+symmetry_degrees = {"none": 0, "half_turn": 180, "quarter_turn": 90}
+"""The rotational symmetry in degrees for each `symmetry` option."""
+
 price = bpy.props.IntProperty(
     name="Price",
     description=("The in-game cost of building this object."),
@@ -14,9 +14,11 @@ import bpy
 import bpy.utils.previews
 import math
 import os
-from . small_scenery_panel import update_small_scenery, set_small_scenery_properties
-from . stall_panel import set_stall_properties
-from . render_task import get_res_path, get_output_path
+from . small_scenery_panel import update_small_scenery, set_small_scenery_properties, add_small_scenery_properties_json
+from . stall_panel import set_stall_properties, add_stall_properties_json
+from . large_scenery_panel import update_large_scenery, set_large_scenery_properties, add_large_scenery_properties_json
+from . render_task import get_res_path, get_output_path, get_cache_directory
+from . import render_cache as render_cache
 from . import render_operator as render_operator
 from . import custom_properties as custom_properties
 from . import json_functions as json_functions
@@ -95,12 +97,12 @@ object_prop_load_issue = "Issue loading object properties for type '%s'."
 object_functions = {
     "scenery_small": set_small_scenery_properties,
     "stall": set_stall_properties,
+    "scenery_large": set_large_scenery_properties,
     # "flat_ride": set_flat_ride_properties,
     # "vehicle": set_vehicle_properties,
     # "footpath": set_footpath_properties,
     # "footpath_banner": set_footpath_banner_properties,
     # "footpath_item": set_footpath_item_properties,
-    # "scenery_large": set_scenery_large_properties,
     # "scenery_wall": set_scenery_wall_properties,
     # "scenery_group": set_scenery_group_properties,
     # "park_entrance": set_park_entrance_properties,
@@ -114,6 +116,45 @@ object_functions = {
 }
 
 
+object_json_functions = {
+    "scenery_small": add_small_scenery_properties_json,
+    "stall": add_stall_properties_json,
+    "scenery_large": add_large_scenery_properties_json,
+}
+
+
+def rebuild_metadata(context):
+    """Regenerates object.json and the .parkobj from the current properties, without rendering
+
+    The images, and their offsets, are reused from the object.json written by
+    the last render.
+
+    Args:
+        context (bpy.types.Context): Context
+
+    Returns:
+        str: A warning if the metadata couldn't be rebuilt, or None
+    """
+    json_path = get_output_path("object.json")
+    if not os.path.exists(json_path):
+        return "Nothing has been rendered yet, so there is no metadata to rebuild."
+    old_json_data = json_functions.read_json_file(json_path)
+    if not isinstance(old_json_data, dict) or old_json_data.get("images") is None:
+        return "The last render's object.json has no images."
+
+    json_functions.json_data.clear()
+    json_functions.add_general_properties_json(context)
+    object_type = context.scene.rct_graphics_helper_general_properties.objectType
+    if object_type in object_json_functions.keys():
+        object_json_functions[object_type](context)
+    else:
+        # There's nothing to generate them from, so keep the properties from the last render
+        json_functions.json_data["properties"] = old_json_data.get("properties", {})
+    json_functions.json_data["images"] = old_json_data["images"]
+    json_functions.make_parkobj(context)
+    return None
+
+
 class RCTImportJSON(bpy.types.Operator):
     """Imports properties from a user-selected JSON object file"""
     bl_idname = "render.rct_import_json"
@@ -147,6 +188,31 @@ class RCTImportJSON(bpy.types.Operator):
         return {'RUNNING_MODAL'}
 
 
+class RCTRebuildMetadata(bpy.types.Operator):
+    """Rebuilds object.json and the .parkobj from the current properties, reusing the last render's images"""
+    bl_idname = "render.rct_rebuild_metadata"
+    bl_label = "Rebuild Metadata"
+
+    def execute(self, context):
+        warning = rebuild_metadata(context)
+        if warning:
+            self.report({'WARNING'}, warning)
+            return {"CANCELLED"}
+        self.report({'INFO'}, 'RCT metadata rebuilt.')
+        return {"FINISHED"}
+
+
+class RCTClearRenderCache(bpy.types.Operator):
+    """Deletes the sprites kept from earlier renders, so everything is rendered again next time"""
+    bl_idname = "render.rct_clear_cache"
+    bl_label = "Clear Render Cache"
+
+    def execute(self, context):
+        render_cache.RenderCache(get_cache_directory()).clear()
+        self.report({'INFO'}, 'RCT render cache cleared.')
+        return {"FINISHED"}
+
+
 class RCTCreateRig(bpy.types.Operator):
     """Create rendering rig and size preview"""
     bl_idname = "render.rct_create_rig"
@@ -347,6 +413,9 @@ def update_object_type(self, context):
     if self.objectType == "scenery_small":
         small_scenery_properties = context.scene.rct_graphics_helper_small_scenery_properties
         update_small_scenery(small_scenery_properties, context)
+    elif self.objectType == "scenery_large":
+        large_scenery_properties = context.scene.rct_graphics_helper_large_scenery_properties
+        update_large_scenery(large_scenery_properties, context)
     pass
 
 
@@ -530,6 +599,15 @@ class GeneralProperties(bpy.types.PropertyGroup):
         name="Dither Threshold",
         description="A value from 0 to 1 that controls how strongly to apply the dithering. 0 disables dithering",
         min=0.00, max=1.00, step=10, precision=2, default=0.30)
+    dither_method = bpy.props.EnumProperty(
+        items=[
+            ("floyd_steinberg", "Floyd-Steinberg", "Best looking error diffusion, one pixel at a time"),
+            ("row_diffusion", "Row Diffusion", "Error diffusion that indexes a whole row at once. Faster, but "
+             "a little more streaky"),
+            ("ordered", "Ordered", "Fastest. Uses a fixed pattern, so animated sprites don't shimmer")],
+        name="Dither Method",
+        description="How the NumPy palettizer dithers (G'MIC always uses its own error diffusion)",
+        default="floyd_steinberg")
     edge_darkening = bpy.props.FloatProperty(
         name="Edge Darkening",
         description="Applies a post-processing darkening around the edges of the rendered sprite. 0 disables",
@@ -539,6 +617,52 @@ class GeneralProperties(bpy.types.PropertyGroup):
         description="Controls whether or not the render contains shadows. Should be disabled for vehicles",
         default=True,
         update=update_shadows)
+    palettize_backend = bpy.props.EnumProperty(
+        items=[
+            ("numpy", "NumPy", "Palettize rendered images inside Blender with NumPy, processing whole batches of "
+             "frames at once"),
+            ("gmic", "G'MIC", "Palettize rendered images by running the G'MIC CLI (which must be on your PATH)")],
+        name="Palettizer",
+        description="The image processing backend used to convert rendered images to the RCT palette",
+        default="numpy")
+    palettize_workers = bpy.props.IntProperty(
+        name="Palettizer Workers",
+        description=("Number of threads to palettize rendered images with at once. 0 uses one for each CPU core, "
+                     "up to 4 (shared between command-line workers)"),
+        default=0,
+        min=0)
+    use_memory_frames = bpy.props.BoolProperty(
+        name="Render to Memory",
+        description=("Passes each render straight from Blender's Viewer Node to the palettizer, without saving it "
+                     "to the output's TMP folder first. Needs the NumPy palettizer and the Default, Standard or Raw "
+                     "view transform"),
+        default=False)
+    use_adaptive_samples = bpy.props.BoolProperty(
+        name="Adaptive Samples",
+        description=("Renders each sprite with more and more samples (up to the scene's sample count), and stops "
+                     "once palettizing it stops changing it. Needs Cycles and the NumPy palettizer"),
+        default=False)
+    adaptive_threshold = bpy.props.IntProperty(
+        name="Changed Pixels",
+        description="Adaptive sampling stops once fewer than this many pixels change between passes",
+        default=4,
+        min=1)
+    use_render_border = bpy.props.BoolProperty(
+        name="Crop to Objects",
+        description=("Only renders the part of each frame that the visible objects cover (plus a small margin), "
+                     "instead of the whole frame"),
+        default=True)
+    use_render_cache = bpy.props.BoolProperty(
+        name="Reuse Renders",
+        description=("Reuses sprites from earlier renders (kept in the output's cache folder) if nothing that "
+                     "affects them has changed, instead of rendering them again"),
+        default=True)
+    render_cache_size = bpy.props.IntProperty(
+        name="Cache Limit (MB)",
+        description="Once a render is finished, the least recently used sprites are deleted from the cache until "
+        "it fits in this size",
+        default=256,
+        min=1)
 
 
 class GeneralPanel(bpy.types.Panel):
@@ -556,6 +680,7 @@ class GeneralPanel(bpy.types.Panel):
         general_properties = scene.rct_graphics_helper_general_properties
         row = layout.row()
         row.operator("render.rct_import_json")
+        row.operator("render.rct_rebuild_metadata")
         # Draw previews
         row = layout.row()
         col = row.column()
@@ -636,9 +761,24 @@ class GeneralPanel(bpy.types.Panel):
         layout.label("Render Settings:")
         row = layout.row()
         row.prop(general_properties, "dither_threshold")
-        row.prop(general_properties, "edge_darkening")
+        row.prop(general_properties, "dither_method")
         row = layout.row()
+        row.prop(general_properties, "edge_darkening")
         row.prop(general_properties, "cast_shadows")
+        row = layout.row()
+        row.prop(general_properties, "palettize_backend")
+        row.prop(general_properties, "palettize_workers")
+        row = layout.row()
+        row.prop(general_properties, "use_render_cache")
+        row.prop(general_properties, "use_memory_frames")
+        row = layout.row()
+        row.prop(general_properties, "render_cache_size")
+        row.operator("render.rct_clear_cache")
+        row = layout.row()
+        row.prop(general_properties, "use_render_border")
+        row = layout.row()
+        row.prop(general_properties, "use_adaptive_samples")
+        row.prop(general_properties, "adaptive_threshold")
 
 
 # Hacky way to have code run on initialization
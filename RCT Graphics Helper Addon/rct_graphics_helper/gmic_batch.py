@@ -0,0 +1,97 @@
+'''
+Copyright (c) 2021 RCT Graphics Helper developers
+
+For a complete list of all authors, please refer to the addon's meta info.
+Interested in contributing? Visit https://github.com/oli414/Blender-RCT-Graphics
+
+RCT Graphics Helper is licensed under the GNU General Public License version 3.
+'''
+
+import subprocess
+
+from . palettize import Offset
+
+
+def parse_offsets(output):
+    """Converts the offsets echoed by Compose and Mask into tuples
+
+    Args:
+        output (str): The stdout of a G'MIC process, with one "x,y" per line
+
+    Returns:
+        list[Offset]: The offset of each image
+    """
+    offsets = []
+    for line in output.splitlines():
+        line = line.strip()
+        if line:
+            x, y = line.split(',')
+            offsets.append(Offset(int(x), int(y)))
+    return offsets
+
+
+class GmicBatch(object):
+    """A list of G'MIC commands that are all run by a single process.
+
+    Commands are given as the same arguments that would be passed on the
+    command line. Each group of commands should be self-contained (e.g. use
+    `-local` ... `-endlocal` and remove its images afterwards), since they all
+    share the same image list.
+    """
+
+    def __init__(self):
+        self.args = []
+
+    def add(self, *args):
+        """Appends the given command line arguments to this batch"""
+        self.args.extend(str(arg) for arg in args)
+
+    def local(self, selection, *args):
+        """Appends commands that run in their own local image list
+
+        Args:
+            selection (str): Selection of existing images to include, e.g.
+                "[0]". Use "" to start from an empty list.
+            *args: The commands to run. Any images left over are removed.
+        """
+        self.add('-local' + selection, *args)
+        if selection:
+            self.add('-remove[%s--1]' % len(selection[1:-1].split(',')))
+        else:
+            self.add('-remove')
+        self.add('-endlocal')
+
+
+class GmicRunner(object):
+    """Runs batches of G'MIC commands.
+
+    Each batch is run by a new `gmic` process that loads the command script
+    (`res/remap.gmic`) once, and then works through all the commands in the
+    batch. This replaces starting a new process for every frame, but there
+    is still one process for every batch.
+    """
+
+    def __init__(self, script_path, gmic="gmic"):
+        """Creates a new runner
+
+        Args:
+            script_path (str): Absolute path to the .gmic file to load
+            gmic (str, optional): The G'MIC executable. Defaults to "gmic".
+        """
+        self.script_path = script_path
+        self.gmic = gmic
+
+    def run(self, batch):
+        """Runs a batch and waits for it to finish
+
+        Args:
+            batch (GmicBatch): The batch to run
+
+        Returns:
+            str: The stdout of the batch
+
+        Raises:
+            subprocess.CalledProcessError: If G'MIC failed
+        """
+        args = [self.gmic, '-verbose', '0', self.script_path] + batch.args
+        return subprocess.run(args, stdout=subprocess.PIPE, check=True).stdout.decode('utf-8')
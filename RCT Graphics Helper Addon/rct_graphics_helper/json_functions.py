@@ -10,6 +10,7 @@ RCT Graphics Helper is licensed under the GNU General Public License version 3.
 import bpy.types
 from collections import namedtuple
 from . render_task import *
+import hashlib
 import json
 import zipfile
 import os
@@ -29,7 +30,16 @@ def add_general_properties_json(context):
     general_properties_dict.pop("capacity_strings_index", None)
     general_properties_dict.pop("edge_darkening", None)
     general_properties_dict.pop("dither_threshold", None)
+    general_properties_dict.pop("dither_method", None)
     general_properties_dict.pop("cast_shadows", None)
+    general_properties_dict.pop("palettize_backend", None)
+    general_properties_dict.pop("palettize_workers", None)
+    general_properties_dict.pop("use_render_cache", None)
+    general_properties_dict.pop("render_cache_size", None)
+    general_properties_dict.pop("use_memory_frames", None)
+    general_properties_dict.pop("use_render_border", None)
+    general_properties_dict.pop("use_adaptive_samples", None)
+    general_properties_dict.pop("adaptive_threshold", None)
     objectType = general_properties_dict.get("objectType", None)
     if objectType in ("stall", "flat_ride", "vehicle"):
         general_properties_dict["objectType"] = "ride"
@@ -143,25 +153,119 @@ def JsonImage(path="", x=0, y=0, format="", keepPalette=True):
     return image
 
 
-def make_parkobj(context):
-    """Creates a .parkobj file from the created images and json"""
-    print("Making parkobj file")
-    name = context.scene.rct_graphics_helper_general_properties.id
-    write_json_file()
-    with zipfile.ZipFile(get_output_path("%s.parkobj" % name), 'w') as parkobj:
+class ParkobjWriter(object):
+    """Builds a .parkobj file a few images at a time.
+
+    Images can be added as soon as they are finished, so most of the archive
+    is already written by the time rendering ends. Identical images are only
+    stored once. The archive is written next to the final file, and only
+    moved into place once `close` adds object.json.
+    """
+
+    def __init__(self, filepath):
+        """Creates a new writer. Nothing is written until the first image is added.
+
+        Args:
+            filepath (str): Absolute path to the .parkobj file to make
+        """
+        self.filepath = filepath
+        self.parkobj = None  # type: zipfile.ZipFile
+        self.paths = {}  # The path that each added image is stored under
+        self.digests = {}  # Path of the first image with each hash
+
+    def open(self):
+        """Opens the partial archive if it isn't open yet"""
+        if self.parkobj is None:
+            self.parkobj = zipfile.ZipFile(self.filepath + ".part", 'w')
+
+    def add_image(self, path):
+        """Adds an image from the output folder to the archive
+
+        Args:
+            path (str): The image's relative path, e.g. "images/0.png"
+
+        Returns:
+            str: The path the image is stored under. This is the path of an
+                earlier image if the two are identical.
+        """
+        stored_path = self.paths.get(path)
+        if stored_path is not None:
+            return stored_path
+        with open(get_output_path(path), "rb") as image_file:
+            data = image_file.read()
+        stored_path = self.digests.setdefault(hashlib.sha1(data).hexdigest(), path)
+        if stored_path == path:
+            self.open()
+            # PNGs are already compressed, so deflating them again only costs time
+            self.parkobj.writestr(path, data, zipfile.ZIP_STORED)
+        self.paths[path] = stored_path
+        return stored_path
+
+    def close(self):
+        """Adds object.json from the output folder, and moves the finished archive into place"""
+        self.open()
         json_file_path = get_output_path("object.json")
         if os.path.exists(json_file_path):
-            parkobj.write(json_file_path, "object.json")
+            self.parkobj.write(json_file_path, "object.json", zipfile.ZIP_DEFLATED)
         else:
             print("WARNING: object.json file not found when writing .parkobj")
-        images_path = get_output_path("images/")
-        if os.path.exists(images_path):
-            for image_name in os.listdir(images_path):
-                image_path = os.path.join(images_path, image_name)
-                parkobj.write(image_path, "images/%s" % image_name)
-        else:
-            print("WARNING: Images not found when writing .parkobj")
-        
+        self.parkobj.close()
+        self.parkobj = None
+        os.replace(self.filepath + ".part", self.filepath)
+
+    def discard(self):
+        """Deletes the partial archive if it wasn't closed, leaving any earlier .parkobj as it was"""
+        if self.parkobj is not None:
+            self.parkobj.close()
+            self.parkobj = None
+        if os.path.exists(self.filepath + ".part"):
+            os.remove(self.filepath + ".part")
+
+
+def add_images(parkobj):
+    """Adds the images in the JSON data to a parkobj, making identical images share a single file
+
+    Any image that is identical to an earlier one is deleted, and its JSON
+    image is pointed at the earlier image's path instead (keeping its own
+    offset). Images that are already in the parkobj aren't read again.
+
+    Args:
+        parkobj (ParkobjWriter): The parkobj to add the images to
+    """
+    removed = 0
+    for image in json_data.get("images", []):
+        if not isinstance(image, dict):
+            continue
+        file_path = get_output_path(image["path"])
+        if image["path"] not in parkobj.paths and not os.path.exists(file_path):
+            print("WARNING: %s not found when writing .parkobj" % image["path"])
+            continue
+        path = parkobj.add_image(image["path"])
+        if path != image["path"]:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+                removed += 1
+            image["path"] = path
+    if removed:
+        print("Removed %s duplicate images" % removed)
+
+
+def make_parkobj(context, parkobj=None):
+    """Creates a .parkobj file from the created images and json
+
+    Args:
+        context (bpy.types.Context): The current context
+        parkobj (ParkobjWriter, optional): A writer that some of the images
+            were already added to while rendering. Defaults to a new one.
+    """
+    print("Making parkobj file")
+    if parkobj is None:
+        name = context.scene.rct_graphics_helper_general_properties.id
+        parkobj = ParkobjWriter(get_output_path("%s.parkobj" % name))
+    add_images(parkobj)
+    write_json_file()
+    parkobj.close()
+
 
 def group_as_dict(group, includeFalse=False):
     """Get values from a bpy property group as a dict."""
@@ -0,0 +1,245 @@
+'''
+Copyright (c) 2021 RCT Graphics Helper developers
+
+For a complete list of all authors, please refer to the addon's meta info.
+Interested in contributing? Visit https://github.com/oli414/Blender-RCT-Graphics
+
+RCT Graphics Helper is licensed under the GNU General Public License version 3.
+'''
+
+import bpy
+import math
+
+from . render_operator import RCTRender
+from . render_task import *
+from . import custom_properties as custom_properties
+from . custom_properties import set_property
+from . import json_functions as json_functions
+
+
+def update_large_scenery(self, context: bpy.types.Context):
+    """Run when when various large scenery properties are updated.
+
+    Updates the size preview and render layers."""
+    properties = self  # type: LargeSceneryProperties
+    scene = context.scene
+    objects = bpy.data.objects
+
+    # Make sure render_layers are set up
+    render_layers = scene.render.layers
+    render_layers.new("Normal")
+    for render_layer in render_layers:
+        if render_layer.name != "Normal":
+            render_layers.remove(render_layer)
+    layer_normal = render_layers.get("Normal")
+    layer_normal.layers = [i == 0 or i == 10 for i in range(20)]
+    layer_normal.layers_zmask = [False for i in range(20)]
+    layer_normal.use_pass_material_index = True
+
+    custom_properties.update_height(self, context)
+    # The size preview covers every tile (see `tile_location`)
+    full_tile = objects.get("RCT_Full_Tile")
+    full_tile.hide = False
+    full_tile.scale = (properties.x_tiles, properties.y_tiles, full_tile.scale[2])
+    full_tile.location = (-(properties.x_tiles - 1) / 2, -(properties.y_tiles - 1) / 2, 0)
+    objects.get("RCT_One_Quarter").hide = True
+    objects.get("RCT_Diagonal_1").hide = True
+    objects.get("RCT_Diagonal_2").hide = True
+    objects.get("RCT_Three_Quarter").hide = True
+    objects.get("RCT_Half_Tile").hide = True
+
+
+def render_scale(x_tiles, y_tiles, height):
+    """Returns how many times bigger than usual the render has to be to fit a large scenery object
+
+    Tiles are 64 pixels wide and 32 pixels deep, and each unit of height is a
+    pixel. The object is rendered from every side, so its tiles could be on
+    either side of the origin.
+
+    Args:
+        x_tiles (int): The number of tiles in the x direction
+        y_tiles (int): The number of tiles in the y direction
+        height (int): The object's height
+    """
+    half_width = 32 * (x_tiles + y_tiles)
+    half_height = 16 * (x_tiles + y_tiles) + height
+    return max(1, int(math.ceil((max(half_width, half_height) + BORDER_MARGIN) / 128)))
+
+
+def add_large_scenery_properties_json(context):
+    """Processes large scenery properties and adds them to the global JSON"""
+    properties = context.scene.rct_graphics_helper_large_scenery_properties  # type: LargeSceneryProperties
+    json_properties = json_functions.group_as_dict(properties)
+    json_properties.pop("x_tiles", None)
+    json_properties.pop("y_tiles", None)
+    json_properties.pop("height", None)
+    # Tiles are in the same order as their images, see `RenderTask.add`
+    json_properties["tiles"] = [{"x": x * 32, "y": y * 32, "z": 0, "clearance": properties.height}
+                                for y in range(properties.y_tiles) for x in range(properties.x_tiles)]
+    if json_properties.get("sceneryGroup", None) == "":
+        json_properties.pop("sceneryGroup", None)
+    json_functions.json_data["properties"] = json_properties
+
+
+def set_large_scenery_properties(context, json_data):
+    """Sets the large scenery properties from the given data
+
+    Args:
+        context (bpy.types.Context): Context
+        json_data (dict): The `properties` field of a JSON object
+
+    Returns:
+        str: If not empty, a warning message to display.
+    """
+    warning = ""
+
+    properties = context.scene.rct_graphics_helper_large_scenery_properties  # type: LargeSceneryProperties
+    set_property(properties, json_data, 'cursor')
+    set_property(properties, json_data, 'price')
+    set_property(properties, json_data, 'removalPrice')
+    set_property(properties, json_data, 'sceneryGroup')
+    set_property(properties, json_data, 'hasPrimaryColour', False)
+    set_property(properties, json_data, 'hasSecondaryColour', False)
+    tiles = json_data.get('tiles', None)
+    if tiles:
+        xs = [tile.get("x", 0) // 32 for tile in tiles]
+        ys = [tile.get("y", 0) // 32 for tile in tiles]
+        properties.x_tiles = max(xs) + 1
+        properties.y_tiles = max(ys) + 1
+        properties.height = max(tile.get("clearance", 0) for tile in tiles)
+        grid = set((x, y) for x in range(properties.x_tiles) for y in range(properties.y_tiles))
+        if (min(xs) < 0 or min(ys) < 0 or set(zip(xs, ys)) != grid or len(tiles) != len(grid)
+                or any(tile.get("z", 0) != 0 for tile in tiles)):
+            warning = "Only a full grid of tiles at the same height is supported, so the tiles have been changed."
+    return warning
+
+
+class RenderLargeScenery(RCTRender, bpy.types.Operator):
+    """Operator to render large scenery objects."""
+    bl_idname = "render.rct_large_scenery"
+    bl_label = "Render RCT Large Scenery"
+
+    def execute(self, context):
+        self.scene = context.scene
+        self.large_scenery_properties = (
+            self.scene.rct_graphics_helper_large_scenery_properties)  # type: LargeSceneryProperties
+        if get_post_render_settings(context).backend != "numpy":
+            self.report({'ERROR'}, "Large scenery needs the NumPy palettizer, which cuts the tiles out of each render.")
+            return {'CANCELLED'}
+        update_large_scenery(self.large_scenery_properties, context)
+        self.render_scale = render_scale(self.large_scenery_properties.x_tiles, self.large_scenery_properties.y_tiles,
+                                         self.large_scenery_properties.height)
+        self.renderTask = RenderTask(context)
+
+        add_large_scenery_properties_json(context)
+        # The whole object's images (which the game uses as previews) come first, followed by each tile's
+        angles = AngleSection(False, 4, 0, 0, 0).angles
+        remap = 0
+        if self.large_scenery_properties.hasSecondaryColour:
+            remap = 2
+        elif self.large_scenery_properties.hasPrimaryColour:
+            remap = 1
+        self.renderTask.add(angles, remap, "Normal", [0, 10], x_tiles=self.large_scenery_properties.x_tiles,
+                            y_tiles=self.large_scenery_properties.y_tiles)
+        return super().execute(context)
+
+    def finished(self, context):
+        """Runs when rendering is completely finished."""
+        super().finished(context)
+        if not self.failed:
+            self.report({'INFO'}, 'RCT Large Scenery render finished.')
+
+
+class LargeSceneryProperties(bpy.types.PropertyGroup):
+    """Defines the group of properties for large scenery objects."""
+    height = bpy.props.IntProperty(
+        name="Height",
+        description=(
+            "Height of the object, where there are 8 units per height step (for reference, a "
+            "\"quarter\" height wall is one step = 8 units high). Therefore this value is generally a "
+            "multiple of eight. Every tile is given this clearance."),
+        default=16,
+        min=0,
+        step=8,
+        update=update_large_scenery)
+    cursor = custom_properties.cursor
+    price = custom_properties.price
+    removalPrice = custom_properties.removalPrice
+    sceneryGroup = bpy.props.StringProperty(
+        name="Group ID",
+        description="OpenRCT2 id of the primary scenery group this object should be included in.")
+
+    hasPrimaryColour = custom_properties.hasPrimaryColour
+    hasSecondaryColour = custom_properties.hasSecondaryColour
+
+    x_tiles = bpy.props.IntProperty(
+        name="X Tiles",
+        description=(
+            "Number of tiles the object covers along the x axis. The first tile is centered on the origin, and the "
+            "others go towards -x"),
+        default=2,
+        min=1,
+        max=16,
+        update=update_large_scenery)
+    y_tiles = bpy.props.IntProperty(
+        name="Y Tiles",
+        description=(
+            "Number of tiles the object covers along the y axis. The first tile is centered on the origin, and the "
+            "others go towards -y"),
+        default=2,
+        min=1,
+        max=16,
+        update=update_large_scenery)
+
+
+class LargeSceneryPanel(bpy.types.Panel):
+    """Defines the drawing function for the RCT Large Scenery panel"""
+    bl_label = "RCT Large Scenery"
+    bl_idname = "RENDER_PT_rct_large_scenery"
+    bl_space_type = 'PROPERTIES'
+    bl_region_type = 'WINDOW'
+    bl_context = "render"
+
+    @classmethod
+    def poll(cls, context: bpy.types.Context):
+        general_properties = context.scene.rct_graphics_helper_general_properties
+        return general_properties.objectType == "scenery_large"
+
+    def draw(self, context):
+        layout = self.layout
+        scene = context.scene
+        large_scenery_properties = scene.rct_graphics_helper_large_scenery_properties  # type: LargeSceneryProperties
+
+        row = layout.row()
+        row.operator("render.rct_large_scenery", text="Render Large Scenery Object")
+
+        row = layout.row().split(0.33, align=True)
+        row.label("Price:")
+        row.prop(large_scenery_properties, "price", text="Place")
+        row.prop(large_scenery_properties, "removalPrice", text="Removal")
+
+        row = layout.row()
+        row.prop(large_scenery_properties, "cursor")
+        row.prop(large_scenery_properties, "height")
+
+        row = layout.row()
+        row.prop(large_scenery_properties, "sceneryGroup")
+
+        row = layout.row(align=True)
+        row.prop(large_scenery_properties, "hasPrimaryColour", toggle=True)
+        row.prop(large_scenery_properties, "hasSecondaryColour", toggle=True)
+
+        row = layout.row()
+        row.prop(large_scenery_properties, "x_tiles")
+        row.prop(large_scenery_properties, "y_tiles")
+
+
+def register_large_scenery_panel():
+    """Registers the large scenery panel and properties"""
+    bpy.types.Scene.rct_graphics_helper_large_scenery_properties = bpy.props.PointerProperty(
+        type=LargeSceneryProperties)
+
+
+def unregister_large_scenery_panel():
+    """Unregisters the large scenery panel and properties"""
+    del bpy.types.Scene.rct_graphics_helper_large_scenery_properties
@@ -0,0 +1,888 @@
+'''
+Copyright (c) 2021 RCT Graphics Helper developers
+
+For a complete list of all authors, please refer to the addon's meta info.
+Interested in contributing? Visit https://github.com/oli414/Blender-RCT-Graphics
+
+RCT Graphics Helper is licensed under the GNU General Public License version 3.
+'''
+
+# This module implements the palettization steps from `res/remap.gmic` with
+# NumPy, so that whole batches of frames can be processed without starting a
+# G'MIC process for every image. It deliberately only depends on the standard
+# library and NumPy (no bpy), so it can be used outside of Blender's main thread.
+
+from collections import namedtuple
+import math
+import os
+import shutil
+import struct
+import zlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+BACKGROUND_COLOR = (23, 35, 35)
+"""Dark grey that semi-transparent edges are blended onto (see OpenIndexNoRemap)."""
+
+ALPHA_THRESHOLD = 16
+"""Alpha values at or above this are considered solid when indexing."""
+
+MASK_THRESHOLD = 5
+"""Alpha values at or above this are considered solid when making a mask."""
+
+NEAREST_CHUNK_SIZE = 16384
+"""Number of pixels to compare against a palette at once."""
+
+Offset = namedtuple("Offset", ["x", "y"])
+"""Where a sprite's top left corner is, relative to the center of the image it was cropped from."""
+
+LUT_BITS = 7
+"""Bits per channel used to look up colors in a palette's lookup table (7 bits is 128x128x128 entries)."""
+
+palettes = {}
+"""Caches loaded palettes, keyed by their absolute path."""
+
+lookup_tables = {}
+"""Caches loaded palette lookup tables, keyed by the palette's absolute path."""
+
+
+def is_available():
+    """Returns True if NumPy could be imported, and this module can be used"""
+    return np is not None
+
+
+# PNG reading and writing
+#########################
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+PNG_COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}
+
+
+def _paeth(a, b, c):
+    """The Paeth predictor used by PNG filter type 4"""
+    p = a + b - c
+    pa = abs(p - a)
+    pb = abs(p - b)
+    pc = abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    if pb <= pc:
+        return b
+    return c
+
+
+def _unfilter(data, height, stride, bpp):
+    """Reverses the per-scanline filters of decompressed PNG data
+
+    Args:
+        data (bytes): Decompressed IDAT data, including the filter type bytes
+        height (int): Number of scanlines
+        stride (int): Number of bytes in each scanline (without filter byte)
+        bpp (int): Number of bytes per complete pixel (at least 1)
+
+    Returns:
+        numpy.ndarray: uint8 array of shape (height, stride)
+    """
+    out = np.zeros((height, stride), dtype=np.uint8)
+    prev = np.zeros(stride, dtype=np.uint8)
+    for y in range(height):
+        start = y * (stride + 1)
+        filter_type = data[start]
+        line = np.frombuffer(data, dtype=np.uint8, count=stride, offset=start + 1).copy()
+        if filter_type == 1:
+            if stride % bpp == 0:
+                line = np.cumsum(line.reshape(-1, bpp), axis=0, dtype=np.uint8).reshape(-1)
+            else:
+                for i in range(bpp, stride):
+                    line[i] += line[i - bpp]
+        elif filter_type == 2:
+            line += prev
+        elif filter_type == 3:
+            cur = bytearray(line.tobytes())
+            up = prev.tobytes()
+            for i in range(stride):
+                left = cur[i - bpp] if i >= bpp else 0
+                cur[i] = (cur[i] + ((left + up[i]) >> 1)) & 0xff
+            line = np.frombuffer(bytes(cur), dtype=np.uint8)
+        elif filter_type == 4:
+            cur = bytearray(line.tobytes())
+            up = prev.tobytes()
+            for i in range(stride):
+                if i >= bpp:
+                    cur[i] = (cur[i] + _paeth(cur[i - bpp], up[i], up[i - bpp])) & 0xff
+                else:
+                    cur[i] = (cur[i] + up[i]) & 0xff
+            line = np.frombuffer(bytes(cur), dtype=np.uint8)
+        elif filter_type != 0:
+            raise ValueError("Invalid PNG filter type %s" % filter_type)
+        out[y] = line
+        prev = out[y]
+    return out
+
+
+def read_png(filepath):
+    """Reads a PNG image into an array
+
+    Palette images are expanded to RGB (or RGBA if they have transparency).
+    Interlaced images are not supported.
+
+    Args:
+        filepath (str): Absolute path to the PNG file
+
+    Returns:
+        numpy.ndarray: Array of shape (height, width, channels). The dtype is
+            uint16 for 16-bit images, and uint8 otherwise.
+    """
+    with open(filepath, "rb") as png_file:
+        data = png_file.read()
+    if data[:8] != PNG_SIGNATURE:
+        raise ValueError("%s is not a PNG file" % filepath)
+
+    pos = 8
+    header = None
+    palette = None
+    transparency = None
+    idat = []
+    while pos < len(data):
+        length, chunk_type = struct.unpack(">I4s", data[pos:pos + 8])
+        chunk = data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+        if chunk_type == b'IHDR':
+            header = struct.unpack(">IIBBBBB", chunk)
+        elif chunk_type == b'PLTE':
+            palette = np.frombuffer(chunk, dtype=np.uint8).reshape(-1, 3)
+        elif chunk_type == b'tRNS':
+            transparency = np.frombuffer(chunk, dtype=np.uint8)
+        elif chunk_type == b'IDAT':
+            idat.append(chunk)
+        elif chunk_type == b'IEND':
+            break
+
+    width, height, bit_depth, color_type, _, _, interlace = header
+    if interlace:
+        raise ValueError("Interlaced PNGs are not supported (%s)" % filepath)
+    channels = PNG_CHANNELS[color_type]
+    bits_per_pixel = channels * bit_depth
+    stride = (width * bits_per_pixel + 7) // 8
+    bpp = max(1, bits_per_pixel // 8)
+    raw = _unfilter(zlib.decompress(b''.join(idat)), height, stride, bpp)
+
+    if bit_depth == 16:
+        image = raw.view(">u2").astype(np.uint16).reshape(height, width, channels)
+    elif bit_depth == 8:
+        image = raw.reshape(height, width, channels)
+    else:
+        # Unpack 1, 2 or 4 bit samples, most significant bits first
+        shifts = np.arange(8 - bit_depth, -1, -bit_depth, dtype=np.uint8)
+        samples = (raw[:, :, None] >> shifts) & ((1 << bit_depth) - 1)
+        image = samples.reshape(height, -1)[:, :width].reshape(height, width, 1).astype(np.uint8)
+        if color_type == 0:
+            image = image * (255 // ((1 << bit_depth) - 1))
+
+    if color_type == 3:
+        indices = image[:, :, 0]
+        colors = palette
+        if transparency is not None:
+            alpha = np.full(len(palette), 255, dtype=np.uint8)
+            alpha[:len(transparency)] = transparency
+            colors = np.concatenate((palette, alpha[:, None]), axis=1)
+        image = colors[indices]
+    return image
+
+
+def png_bit_depth(filepath):
+    """Returns the bit depth of a PNG file (e.g. 8 or 16), reading only its header
+
+    Args:
+        filepath (str): Absolute path to the PNG file
+    """
+    with open(filepath, "rb") as png_file:
+        data = png_file.read(8 + 8 + 13)
+    if data[:8] != PNG_SIGNATURE or data[12:16] != b'IHDR':
+        raise ValueError("%s is not a PNG file" % filepath)
+    return data[24]
+
+
+def _png_chunk(chunk_type, data):
+    """Returns the bytes of a complete PNG chunk"""
+    return (struct.pack(">I", len(data)) + chunk_type + data
+            + struct.pack(">I", zlib.crc32(chunk_type + data) & 0xffffffff))
+
+
+def write_png(filepath, image, compression=6):
+    """Writes an 8-bit array as a PNG image
+
+    Args:
+        filepath (str): Absolute path of the PNG file to write
+        image (numpy.ndarray): uint8 array of shape (height, width) for greyscale
+            images, or (height, width, channels) with 1 to 4 channels
+        compression (int, optional): zlib compression level. Defaults to 6.
+    """
+    image = np.asarray(image, dtype=np.uint8)
+    if image.ndim == 2:
+        image = image[:, :, None]
+    height, width, channels = image.shape
+    rows = image.reshape(height, width * channels)
+    raw = np.concatenate((np.zeros((height, 1), dtype=np.uint8), rows), axis=1)
+    header = struct.pack(">IIBBBBB", width, height, 8, PNG_COLOR_TYPES[channels], 0, 0, 0)
+    with open(filepath, "wb") as png_file:
+        png_file.write(PNG_SIGNATURE)
+        png_file.write(_png_chunk(b'IHDR', header))
+        png_file.write(_png_chunk(b'IDAT', zlib.compress(raw.tobytes(), compression)))
+        png_file.write(_png_chunk(b'IEND', b''))
+
+
+def link_file(source, destination):
+    """Makes `destination` a hard link to `source`, or a copy where hard links aren't supported
+
+    This is used for images that are written twice with the same content,
+    like the preview of a mask.
+    """
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def load_rgba(filepath):
+    """Loads a rendered frame as float RGBA values from 0 to 255
+
+    Args:
+        filepath (str): Absolute path to a PNG file
+
+    Returns:
+        numpy.ndarray: float32 array of shape (height, width, 4)
+    """
+    image = read_png(filepath)
+    if image.dtype == np.uint16:
+        image = image.astype(np.float32) / 257
+    else:
+        image = image.astype(np.float32)
+    channels = image.shape[2]
+    if channels < 3:
+        # Greyscale (with or without alpha)
+        image = np.concatenate((image[:, :, :1].repeat(3, axis=2), image[:, :, 1:]), axis=2)
+    if image.shape[2] == 3:
+        image = np.concatenate((image, np.full(image.shape[:2] + (1,), 255, dtype=np.float32)), axis=2)
+    return image
+
+
+def load_frames(filepaths):
+    """Loads a list of rendered frames into a single array
+
+    Args:
+        filepaths (list): Absolute paths to PNG files of the same size. Frames
+            that are already in memory (as returned by `viewer_channels`) can
+            be given instead of a path.
+
+    Returns:
+        numpy.ndarray: float32 array of shape (frames, height, width, 4)
+    """
+    return np.stack([load_rgba(filepath) if isinstance(filepath, str) else filepath for filepath in filepaths])
+
+
+# Frames from Blender's Viewer Node
+###################################
+
+def linear_to_srgb(values):
+    """Applies the sRGB transfer function to linear values from 0 to 1"""
+    return np.where(values <= 0.0031308, values * 12.92, 1.055 * np.power(values, 1 / 2.4) - 0.055)
+
+
+def _encode_channel(rgb, alpha, to_srgb):
+    """Converts premultiplied linear colors into 0-255 RGBA, like Blender does when saving a PNG"""
+    safe_alpha = np.where(alpha > 0, alpha, 1)[:, :, None]
+    straight = np.clip(np.where(alpha[:, :, None] > 0, rgb / safe_alpha, 0), 0, 1)
+    if to_srgb:
+        straight = linear_to_srgb(straight)
+    return np.round(np.concatenate((straight, alpha[:, :, None]), axis=2) * 255).astype(np.float32)
+
+
+def viewer_channels(pixels, width, height, remap, to_srgb=True):
+    """Splits the pixels of Blender's Viewer Node into the frames that would have been saved to disk
+
+    The Viewer Node is given the render's premultiplied linear colors, with
+    its alpha channel set to alpha + 2 * material index. The material index
+    picks out the remappable parts, the same way the `RCT_RemapOutput`
+    node group does.
+
+    Args:
+        pixels (sequence[float]): The Viewer Node image's pixels, bottom row
+            first (i.e. `bpy.types.Image.pixels`)
+        width (int): Width of the image
+        height (int): Height of the image
+        remap (int): -1 for mask; 0 for no remap colors; 1, 2, or 3 for remap
+        to_srgb (bool, optional): Apply the sRGB transfer function, for the
+            "Default" and "Standard" view transforms. Defaults to True.
+
+    Returns:
+        list[numpy.ndarray]: A float32 array of shape (height, width, 4), with
+            values from 0 to 255, for each channel (noremap, remap1, ...). If
+            `remap` is 0 or -1, just the rendered image.
+    """
+    packed = np.asarray(pixels, dtype=np.float32).reshape(height, width, 4)[::-1]
+    rgb = packed[:, :, :3]
+    material_index = np.round((packed[:, :, 3] - 0.5) / 2)
+    alpha = np.clip(packed[:, :, 3] - 2 * material_index, 0, 1)
+    if remap <= 0:
+        return [_encode_channel(rgb, alpha, to_srgb)]
+    channels = [_encode_channel(rgb, np.minimum(alpha, material_index == 0), to_srgb)]
+    for i in range(1, remap + 1):
+        channels.append(_encode_channel(rgb, (material_index == i).astype(np.float32), to_srgb))
+    return channels
+
+
+def load_palette(filepath):
+    """Loads a palette image, caching the result
+
+    Palette images are a single column of pixels, where each pixel is one
+    palette entry.
+
+    Args:
+        filepath (str): Absolute path to the palette image
+
+    Returns:
+        numpy.ndarray: float32 array of shape (colors, 3)
+    """
+    palette = palettes.get(filepath)
+    if palette is None:
+        image = read_png(filepath)
+        palette = image[:, :, :3].reshape(-1, 3).astype(np.float32)
+        palettes[filepath] = palette
+    return palette
+
+
+def lut_path(filepath):
+    """Returns where the lookup table for a palette image is saved (next to the palette)"""
+    return "%s_lut%s.npy" % (os.path.splitext(filepath)[0], LUT_BITS)
+
+
+def build_lut(palette):
+    """Finds the nearest palette entry for every cell of an RGB lookup table
+
+    Args:
+        palette (numpy.ndarray): float array of shape (entries, 3)
+
+    Returns:
+        numpy.ndarray: uint8 array of shape (cells, cells, cells), where
+            cells is 2 ** LUT_BITS
+    """
+    cells = 1 << LUT_BITS
+    step = 256 / cells
+    centers = (np.arange(cells, dtype=np.float32) + 0.5) * step
+    grid = np.stack(np.meshgrid(centers, centers, centers, indexing="ij"), axis=-1).reshape(-1, 3)
+    return nearest_index(grid, palette).astype(np.uint8).reshape(cells, cells, cells)
+
+
+def load_lut(filepath):
+    """Loads the lookup table for a palette image, building and saving it if needed
+
+    The table is saved next to the palette, and rebuilt whenever the palette
+    image is newer. If it can't be saved (e.g. the add-on folder is read-only),
+    it is only kept in memory.
+
+    Args:
+        filepath (str): Absolute path to the palette image
+
+    Returns:
+        numpy.ndarray: The palette's lookup table, see `build_lut`
+    """
+    lut = lookup_tables.get(filepath)
+    if lut is not None:
+        return lut
+    path = lut_path(filepath)
+    cells = 1 << LUT_BITS
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(filepath):
+        try:
+            lut = np.load(path)
+        except (OSError, ValueError):
+            lut = None
+        if lut is not None and lut.shape != (cells, cells, cells):
+            lut = None
+    if lut is None:
+        lut = build_lut(load_palette(filepath))
+        try:
+            # Saved under a temporary name first, so other processes never load half a table
+            temp_path = "%s.%s.tmp" % (path, os.getpid())
+            with open(temp_path, "wb") as lut_file:
+                np.save(lut_file, lut)
+            os.replace(temp_path, path)
+        except OSError:
+            print("WARNING: Could not save palette lookup table to %s" % path)
+    lookup_tables[filepath] = lut
+    return lut
+
+
+def lookup_index(colors, lut):
+    """Finds the (approximately) nearest palette entry for each color using a lookup table
+
+    Args:
+        colors (numpy.ndarray): float array with 3 channels in the last axis
+        lut (numpy.ndarray): The palette's lookup table, see `load_lut`
+
+    Returns:
+        numpy.ndarray: int array with the same shape as `colors`, without the
+            channel axis
+    """
+    cells = np.clip(colors, 0, 255).astype(np.intp) >> (8 - LUT_BITS)
+    return lut[cells[..., 0], cells[..., 1], cells[..., 2]].astype(np.intp)
+
+
+# Image processing
+##################
+
+def blur(images, sigma, axes=(1, 2)):
+    """Applies a gaussian blur to a stack of images
+
+    Args:
+        images (numpy.ndarray): float array of shape (frames, height, width, ...)
+        sigma (float): Standard deviation of the blur, in pixels
+        axes (tuple[int], optional): The (y, x) axes to blur along
+
+    Returns:
+        numpy.ndarray: The blurred images
+    """
+    if sigma <= 0:
+        return images
+    radius = max(1, int(math.ceil(3 * sigma)))
+    kernel = np.exp(-0.5 * (np.arange(-radius, radius + 1) / sigma) ** 2)
+    kernel /= kernel.sum()
+    for axis in axes:
+        padding = [(0, 0)] * images.ndim
+        padding[axis] = (radius, radius)
+        padded = np.pad(images, padding, mode="edge")
+        length = images.shape[axis]
+        blurred = np.zeros_like(images)
+        for i, weight in enumerate(kernel):
+            blurred += weight * padded.take(np.arange(i, i + length), axis=axis)
+        images = blurred
+    return images
+
+
+def normalize(images, low, high):
+    """Linearly normalizes each image in a stack to the given range"""
+    flat = images.reshape(len(images), -1)
+    minimum = flat.min(axis=1).reshape((-1,) + (1,) * (images.ndim - 1))
+    maximum = flat.max(axis=1).reshape((-1,) + (1,) * (images.ndim - 1))
+    scale = np.where(maximum > minimum, maximum - minimum, 1)
+    return low + (images - minimum) * ((high - low) / scale)
+
+
+def edge_mask(opaque, edge_darkening):
+    """Creates the multiplier used to darken the edges of each sprite
+
+    Equivalent to the `-blur`, `-cut 50%,80%` and `-n 0,1` steps applied to the
+    alpha channel in OpenIndexRemap/OpenIndexNoRemap.
+
+    Args:
+        opaque (numpy.ndarray): bool array of shape (frames, height, width)
+        edge_darkening (float): How strongly to darken edges. 0 disables
+
+    Returns:
+        numpy.ndarray: float32 array of shape (frames, height, width), from 0 to 1
+    """
+    alpha = opaque.astype(np.float32) * 255
+    alpha = blur(alpha, (2 ** edge_darkening - 1) * 1.0)
+    flat = alpha.reshape(len(alpha), -1)
+    minimum = flat.min(axis=1)[:, None, None]
+    maximum = flat.max(axis=1)[:, None, None]
+    low = minimum + (maximum - minimum) * 0.5
+    high = minimum + (maximum - minimum) * 0.8
+    alpha = np.clip(alpha, low, high)
+    return np.where(high > low, (alpha - low) / np.where(high > low, high - low, 1), opaque)
+
+
+def luminance(rgb):
+    """Converts sRGB values from 0 to 255 into perceived greyscale values
+
+    Args:
+        rgb (numpy.ndarray): float array with 3 channels in the last axis
+
+    Returns:
+        numpy.ndarray: float array without the channel axis
+    """
+    srgb = rgb / 255
+    linear = np.where(srgb <= 0.04045, srgb / 12.92, ((srgb + 0.055) / 1.055) ** 2.4)
+    y = linear.dot(np.array([0.2126, 0.7152, 0.0722], dtype=np.float32))
+    return np.where(y <= 0.0031308, y * 12.92, 1.055 * y ** (1 / 2.4) - 0.055) * 255
+
+
+def nearest_index(colors, palette):
+    """Finds the index of the closest palette entry for each color
+
+    Args:
+        colors (numpy.ndarray): float array of shape (pixels, channels)
+        palette (numpy.ndarray): float array of shape (entries, channels)
+
+    Returns:
+        numpy.ndarray: int array of shape (pixels,)
+    """
+    colors = colors.astype(np.float32)
+    palette = palette.astype(np.float32)
+    squared = (palette ** 2).sum(axis=1)
+    indices = np.empty(len(colors), dtype=np.intp)
+    for start in range(0, len(colors), NEAREST_CHUNK_SIZE):
+        chunk = colors[start:start + NEAREST_CHUNK_SIZE]
+        distances = squared[None, :] - 2 * chunk.dot(palette.T)
+        indices[start:start + NEAREST_CHUNK_SIZE] = distances.argmin(axis=1)
+    return indices
+
+
+def bounding_box(mask):
+    """Returns (top, bottom, left, right) of the True values in a 2D mask, or None"""
+    rows = np.flatnonzero(mask.any(axis=1))
+    if len(rows) == 0:
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    return rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+
+
+DITHER_METHODS = ("floyd_steinberg", "row_diffusion", "ordered")
+"""The dithering methods `index_images` supports, from best looking to fastest."""
+
+
+def bayer_matrix(size=8):
+    """Returns a Bayer threshold matrix, with values spread evenly from -0.5 to 0.5
+
+    Args:
+        size (int, optional): Width and height of the matrix. Must be a power
+            of 2. Defaults to 8.
+
+    Returns:
+        numpy.ndarray: float32 array of shape (size, size)
+    """
+    matrix = np.zeros((1, 1), dtype=np.float32)
+    while len(matrix) < size:
+        matrix = np.vstack([np.hstack([4 * matrix, 4 * matrix + 2]), np.hstack([4 * matrix + 3, 4 * matrix + 1])])
+    return ((matrix + 0.5) / matrix.size - 0.5).astype(np.float32)
+
+
+def palette_spacing(palette):
+    """Returns the typical distance between neighboring palette entries
+
+    This is the median distance from each entry to its closest other entry,
+    which is how far ordered dithering has to push a color to reach the next.
+    """
+    palette = palette.astype(np.float32)
+    distances = ((palette[:, None, :] - palette[None, :, :]) ** 2).sum(axis=2)
+    np.fill_diagonal(distances, np.inf)
+    return float(np.median(np.sqrt(distances.min(axis=1))))
+
+
+def nearest(colors, palette, lut=None):
+    """Finds the nearest palette entry for each color, using the lookup table if there is one
+
+    Args:
+        colors (numpy.ndarray): float array with the palette's channels in the last axis
+        palette (numpy.ndarray): float array of shape (entries, channels)
+        lut (numpy.ndarray, optional): The palette's lookup table, see `load_lut`
+
+    Returns:
+        numpy.ndarray: int array with the shape of `colors`, without the channel axis
+    """
+    if lut is not None:
+        return lookup_index(colors, lut)
+    shape = colors.shape[:-1]
+    return nearest_index(colors.reshape(-1, colors.shape[-1]), palette).reshape(shape)
+
+
+def index_images(images, palette, dither=0.0, opaque=None, lut=None, method="floyd_steinberg"):
+    """Converts a stack of images into indices of the nearest palette colors
+
+    Every dithering method processes all the frames in the same pass:
+
+    - "floyd_steinberg": Floyd-Steinberg error diffusion, one pixel at a time.
+    - "row_diffusion": Each row is indexed at once, and its error is spread
+      over the pixels below (1/4 down-left, 1/2 down, 1/4 down-right).
+    - "ordered": Each pixel is offset by an 8x8 Bayer matrix before being
+      indexed. Pixels don't depend on each other, and the pattern is the same
+      in every frame, so animations don't shimmer.
+
+    The dithering strength is scaled by `dither`. If a lookup table is given,
+    each pixel's palette entry is looked up in it instead of being searched
+    for in the palette.
+
+    Args:
+        images (numpy.ndarray): float array of shape (frames, height, width, channels)
+        palette (numpy.ndarray): float array of shape (entries, channels)
+        dither (float, optional): Dithering level from 0 to 1. Defaults to 0.
+        opaque (numpy.ndarray, optional): bool array of shape (frames, height,
+            width). If given, only pixels inside this mask are guaranteed to be
+            indexed, and the rest are left as 0.
+        lut (numpy.ndarray, optional): The palette's lookup table (see
+            `load_lut`), for RGB images. Defaults to None.
+        method (str, optional): One of DITHER_METHODS. Defaults to
+            "floyd_steinberg".
+
+    Returns:
+        numpy.ndarray: int array of shape (frames, height, width)
+    """
+    frames, height, width, channels = images.shape
+    if opaque is None:
+        opaque = np.ones((frames, height, width), dtype=bool)
+    indices = np.zeros((frames, height, width), dtype=np.intp)
+    if dither <= 0:
+        indices[opaque] = nearest(images[opaque], palette, lut)
+        return indices
+    if method == "ordered":
+        matrix = bayer_matrix()
+        thresholds = np.tile(matrix, (-(-height // len(matrix)), -(-width // len(matrix))))[:height, :width]
+        offsets = np.broadcast_to(thresholds * (palette_spacing(palette) * dither), opaque.shape)
+        indices[opaque] = nearest(images[opaque] + offsets[opaque][:, None], palette, lut)
+        return indices
+
+    box = bounding_box(opaque.any(axis=0))
+    if box is None:
+        return indices
+    top, bottom, left, right = box
+    work = images[:, top:bottom, left:right].astype(np.float32)
+    out = indices[:, top:bottom, left:right]
+    palette = palette.astype(np.float32)
+    h, w = bottom - top, right - left
+    if method == "row_diffusion":
+        for y in range(h):
+            row = work[:, y]
+            index = nearest(row, palette, lut)
+            out[:, y] = index
+            if y + 1 < h:
+                error = (row - palette[index]) * dither
+                below = work[:, y + 1]
+                below += error * (1 / 2)
+                below[:, :-1] += error[:, 1:] * (1 / 4)
+                below[:, 1:] += error[:, :-1] * (1 / 4)
+        return indices
+
+    for y in range(h):
+        row = work[:, y]
+        below = work[:, y + 1] if y + 1 < h else None
+        for x in range(w):
+            value = row[:, x]
+            if lut is not None:
+                index = lookup_index(value, lut)
+            else:
+                index = ((value[:, None, :] - palette[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+            out[:, y, x] = index
+            error = (value - palette[index]) * dither
+            if x + 1 < w:
+                row[:, x + 1] += error * (7 / 16)
+            if below is not None:
+                if x > 0:
+                    below[:, x - 1] += error * (3 / 16)
+                below[:, x] += error * (5 / 16)
+                if x + 1 < w:
+                    below[:, x + 1] += error * (1 / 16)
+    return indices
+
+
+def index_no_remap(frames, palette, dither=0.35, edge_darkening=1.0, blur_amount=0.3, lut=None,
+                   method="floyd_steinberg"):
+    """Palettizes frames without remappable colors (OpenIndexNoRemap)
+
+    Args:
+        frames (numpy.ndarray): float RGBA array of shape (frames, height, width, 4)
+        palette (numpy.ndarray): The palette to index into
+        dither (float, optional): Dithering level. Defaults to 0.35.
+        edge_darkening (float, optional): Edge darkening amount. Defaults to 1.0.
+        blur_amount (float, optional): Blur applied before indexing. Defaults to 0.3.
+        lut (numpy.ndarray, optional): The palette's lookup table, see `load_lut`
+        method (str, optional): The dithering method, see `index_images`
+
+    Returns:
+        tuple[numpy.ndarray, numpy.ndarray]: Indices into `palette` and the
+            bool mask of which pixels are opaque, both of shape (frames, height, width)
+    """
+    opaque = frames[..., 3] >= ALPHA_THRESHOLD
+    images = blur(frames, blur_amount) * edge_mask(opaque, edge_darkening)[..., None]
+    alpha = images[..., 3:] / 255
+    background = np.array(BACKGROUND_COLOR, dtype=np.float32)
+    rgb = images[..., :3] * alpha + background * (1 - alpha)
+    return index_images(rgb, palette, dither, opaque, lut, method), opaque
+
+
+def index_remap(frames, palette, dither=0.35, edge_darkening=1.0, blur_amount=0.3, method="floyd_steinberg"):
+    """Palettizes frames using a remappable color's shades (OpenIndexRemap)
+
+    The frames are converted to greyscale, and each shade of the remap palette
+    is used for an equal part of the range from the darkest to lightest value.
+
+    Args:
+        frames (numpy.ndarray): float RGBA array of shape (frames, height, width, 4)
+        palette (numpy.ndarray): The remap palette to index into
+        dither (float, optional): Dithering level. Defaults to 0.35.
+        edge_darkening (float, optional): Edge darkening amount. Defaults to 1.0.
+        blur_amount (float, optional): Blur applied before indexing. Defaults to 0.3.
+        method (str, optional): The dithering method, see `index_images`
+
+    Returns:
+        tuple[numpy.ndarray, numpy.ndarray]: Indices into `palette` and the
+            bool mask of which pixels are opaque, both of shape (frames, height, width)
+    """
+    opaque = frames[..., 3] >= ALPHA_THRESHOLD
+    grey = normalize(luminance(frames[..., :3]), 0, 255)
+    grey = blur(grey, blur_amount) * edge_mask(opaque, edge_darkening)
+    levels = len(palette)
+    grey_palette = (np.arange(levels, dtype=np.float32) * (255 / (levels - 1)))[:, None]
+    return index_images(grey[..., None], grey_palette, dither, opaque, method=method), opaque
+
+
+def palette_to_full(palette, full_palette):
+    """Returns, for each entry of `palette`, the index of the same color in `full_palette`"""
+    return nearest_index(palette, full_palette)
+
+
+def compose(layers, shape):
+    """Stacks palettized layers on top of each other (Compose)
+
+    Args:
+        layers (list[tuple[numpy.ndarray, numpy.ndarray]]): (full palette
+            indices, opaque mask) for each layer, from bottom to top
+        shape (tuple[int]): (frames, height, width) of the result
+
+    Returns:
+        numpy.ndarray: uint8 array of full palette indices, where 0 is transparent
+    """
+    composed = np.zeros(shape, dtype=np.uint8)
+    for indices, opaque in layers:
+        composed[opaque] = indices[opaque]
+    return composed
+
+
+def mask(frames, solid_index=55):
+    """Turns frames into binary masks based on their alpha channel (Mask)
+
+    Args:
+        frames (numpy.ndarray): float RGBA array of shape (frames, height, width, 4)
+        solid_index (int, optional): Palette index to use for solid pixels
+
+    Returns:
+        numpy.ndarray: uint8 array of shape (frames, height, width)
+    """
+    return np.where(frames[..., 3] >= MASK_THRESHOLD, solid_index, 0).astype(np.uint8)
+
+
+def polygon_mask(polygon, height, width):
+    """Returns which pixels have their center inside a convex polygon
+
+    Args:
+        polygon (list[tuple[float, float]]): The (x, y) pixel coordinates of
+            the polygon's corners, in order around it (either direction)
+        height (int): Height of the mask
+        width (int): Width of the mask
+
+    Returns:
+        numpy.ndarray: bool array of shape (height, width)
+    """
+    ys, xs = np.mgrid[0:height, 0:width] + 0.5
+    inside = np.ones((height, width), dtype=bool)
+    edges = list(zip(polygon, polygon[1:] + polygon[:1]))
+    # Twice the signed area, so the inside is on the same side of every edge either way around
+    direction = 1 if sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in edges) >= 0 else -1
+    for (x0, y0), (x1, y1) in edges:
+        inside &= direction * ((x1 - x0) * (ys - y0) - (y1 - y0) * (xs - x0)) >= 0
+    return inside
+
+
+def tile_labels(frame_columns, shape):
+    """Splits renders of a multi-tile object up between its tiles
+
+    Each pixel goes to the nearest tile whose column covers it. The game draws
+    nearer tiles over farther ones, so the tiles look the same put back
+    together as the render did.
+
+    Args:
+        frame_columns (list[list[tuple[list[tuple[float, float]], float]]]):
+            For each render, and each tile in it, the outline of the column
+            above the tile (see `polygon_mask`), and its distance from the
+            camera
+        shape (tuple[int, int, int]): Shape of the stack of renders, as
+            (frames, height, width)
+
+    Returns:
+        numpy.ndarray: int16 array of the given shape with the index of the
+            tile each pixel belongs to, or -1 for none
+    """
+    labels = np.full(shape, -1, dtype=np.int16)
+    for frame_labels, columns in zip(labels, frame_columns):
+        for tile in sorted(range(len(columns)), key=lambda tile: columns[tile][1]):
+            frame_labels[polygon_mask(columns[tile][0], *frame_labels.shape) & (frame_labels < 0)] = tile
+    return labels
+
+
+def cut_tile(images, labels, tile):
+    """Returns a copy of a stack of palettized images with only one tile's pixels left
+
+    Args:
+        images (numpy.ndarray): array of palette indices of shape (frames, height, width)
+        labels (numpy.ndarray): The `tile_labels` of the images
+        tile (int): Index of the tile to keep
+    """
+    return np.where(labels == tile, images, 0).astype(images.dtype)
+
+
+def bounding_boxes(images):
+    """Finds the non-transparent area of every image in a stack at once
+
+    Args:
+        images (numpy.ndarray): array of palette indices of shape (frames,
+            height, width), where 0 is transparent
+
+    Returns:
+        numpy.ndarray: int array of shape (frames, 4), with the (top, bottom,
+            left, right) of each image. Empty images get a 1x1 box in their top
+            left corner.
+    """
+    solid = images != 0
+    rows = solid.any(axis=2)
+    columns = solid.any(axis=1)
+    height, width = images.shape[1:]
+    boxes = np.stack([rows.argmax(axis=1), height - rows[:, ::-1].argmax(axis=1),
+                      columns.argmax(axis=1), width - columns[:, ::-1].argmax(axis=1)], axis=1)
+    boxes[~rows.any(axis=1)] = (0, 1, 0, 1)
+    return boxes
+
+
+def autocrop(images):
+    """Crops away the transparent (index 0) border of each image in a stack
+
+    Args:
+        images (numpy.ndarray): array of palette indices of shape (frames, height, width)
+
+    Returns:
+        list[tuple[numpy.ndarray, Offset]]: For each image, a cropped view of
+            it (not a copy), and the offset of its top left corner relative to
+            the center of the uncropped image
+    """
+    height, width = images.shape[1:]
+    return [(image[top:bottom, left:right], Offset(int(left) - width // 2, int(top) - height // 2))
+            for image, (top, bottom, left, right) in zip(images, bounding_boxes(images))]
+
+
+def write_sprites(images, image_paths, preview_paths, palette=None):
+    """Autocrops a stack of indexed images and writes each one and its preview
+
+    Args:
+        images (numpy.ndarray): array of palette indices of shape (frames, height, width)
+        image_paths (list[str]): Path to write each indexed image to
+        preview_paths (list[str]): Path to write each preview image to
+        palette (numpy.ndarray, optional): Palette used to color the previews.
+            If None, each preview is a hard link to the indexed image.
+
+    Returns:
+        list[Offset]: The offset of each sprite
+    """
+    offsets = []
+    for (cropped, offset), image_path, preview_path in zip(autocrop(images), image_paths, preview_paths):
+        write_png(image_path, cropped)
+        if palette is None:
+            link_file(image_path, preview_path)
+        else:
+            write_png(preview_path, palette[cropped].astype(np.uint8))
+        offsets.append(offset)
+    return offsets
@@ -0,0 +1,114 @@
+'''
+Copyright (c) 2021 RCT Graphics Helper developers
+
+For a complete list of all authors, please refer to the addon's meta info.
+Interested in contributing? Visit https://github.com/oli414/Blender-RCT-Graphics
+
+RCT Graphics Helper is licensed under the GNU General Public License version 3.
+'''
+
+from concurrent.futures import Future, ThreadPoolExecutor
+import os
+
+
+DEFAULT_WORKERS = 4
+"""Maximum number of jobs to run at once (in each Blender process) if no number is given."""
+
+
+def default_worker_count(processes=1):
+    """Returns how many jobs to run at once in each of several Blender processes
+
+    The CPUs are shared between the processes, and each one gets at least
+    one worker and at most DEFAULT_WORKERS.
+
+    Args:
+        processes (int, optional): The number of Blender processes rendering
+            at once (e.g. shards). Defaults to 1.
+    """
+    return max(1, min((os.cpu_count() or 1) // max(1, processes), DEFAULT_WORKERS))
+
+
+class PostRenderPipeline(object):
+    """Runs post-render jobs in the background while rendering continues.
+
+    Jobs are started in the order they are submitted. `drain` waits for all of
+    them and returns their results in that same order, no matter which job
+    finished first. A job that raises an exception has no result; `error`
+    returns the exception instead. Jobs must not touch `bpy`; anything they
+    need from the scene has to be read on the main thread and passed in as
+    arguments.
+    """
+
+    def __init__(self, max_workers=1):
+        """Creates a new pipeline
+
+        Jobs run in threads. Forking a worker process would copy Blender,
+        with its open files and its own threads, which isn't safe.
+
+        Args:
+            max_workers (int, optional): Maximum number of jobs to run at once.
+                Defaults to 1.
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+        self.jobs = []
+
+    def submit(self, function, *args):
+        """Queues `function(*args)` to run in the background
+
+        Returns:
+            int: The index of the job's result in the list returned by `drain`
+        """
+        self.jobs.append(self.executor.submit(function, *args))
+        return len(self.jobs) - 1
+
+    def pending(self):
+        """Returns the number of submitted jobs that have not finished yet"""
+        return sum(1 for job in self.jobs if not job.done())
+
+    def done(self, index):
+        """Returns True if a job has finished, whether or not it succeeded"""
+        return self.jobs[index].done()
+
+    def result(self, index):
+        """Returns the result of a job if it finished successfully, or None if it hasn't
+
+        Args:
+            index (int): The job's index, as returned by `submit`
+        """
+        job = self.jobs[index]
+        if not job.done() or job.exception() is not None:
+            return None
+        return job.result()
+
+    def error(self, index):
+        """Returns the exception a finished job raised, or None if it didn't raise one
+
+        Args:
+            index (int): The job's index, as returned by `submit`
+        """
+        job = self.jobs[index]
+        if not job.done():
+            return None
+        return job.exception()
+
+    def forget(self, index):
+        """Drops the result of a finished job that has already been used, so it isn't kept until `drain`
+
+        Its result in `drain` is None from then on.
+
+        Args:
+            index (int): The job's index, as returned by `submit`
+        """
+        forgotten = Future()
+        forgotten.set_result(None)
+        self.jobs[index] = forgotten
+
+    def drain(self):
+        """Waits for all submitted jobs to finish and shuts the pipeline down
+
+        Returns:
+            list: The result of each job, in the order they were submitted. Jobs
+                that raised an exception have None (see `error`).
+        """
+        self.executor.shutdown(wait=True)
+        return [self.result(index) for index in range(len(self.jobs))]
@@ -0,0 +1,400 @@
+'''
+Copyright (c) 2021 RCT Graphics Helper developers
+
+For a complete list of all authors, please refer to the addon's meta info.
+Interested in contributing? Visit https://github.com/oli414/Blender-RCT-Graphics
+
+RCT Graphics Helper is licensed under the GNU General Public License version 3.
+'''
+
+from array import array
+import bpy
+import hashlib
+import json
+import os
+import shutil
+
+
+CACHE_VERSION = 1
+"""Change this whenever rendering or palettization changes, to throw out old cached sprites."""
+
+ANIMATED_PROPERTIES = {
+    "location", "rotation_euler", "rotation_quaternion", "rotation_axis_angle", "scale",
+    "delta_location", "delta_rotation_euler", "delta_rotation_quaternion", "delta_scale",
+    "matrix_world", "matrix_local", "matrix_basis", "matrix_parent_inverse"}
+"""Object properties that are left out of `scene_hash`, since they're hashed for each frame instead."""
+
+VOLATILE_PREFIXES = ("select", "hide", "show_", "total_", "is_")
+"""Properties starting with these don't affect rendering (or are hashed for each frame instead)."""
+
+file_digests = {}
+"""The content hash of each image file read by `hash_file`, by (path, modification time, size)."""
+
+
+def hash_value(value):
+    """Returns a property value in a form whose repr() shows what it holds (and not just where it is)"""
+    if hasattr(value, "__len__") and not isinstance(value, str):
+        return tuple(value)
+    return value
+
+
+def hash_rna(hasher, struct, skip=()):
+    """Adds the simple properties of a bpy struct to a hash
+
+    Pointers to other datablocks are hashed by name, so switching e.g. a
+    modifier's target changes the hash. The datablocks' own contents have to
+    be hashed separately (e.g. with `hash_image`).
+
+    Args:
+        hasher (hashlib.sha1): The hash to update
+        struct (bpy.types.bpy_struct): The struct to hash, e.g. a Material
+        skip (set[str], optional): Names of properties to leave out
+    """
+    if struct is None:
+        hasher.update(b"None;")
+        return
+    for prop in struct.bl_rna.properties:
+        identifier = prop.identifier
+        if (identifier == "rna_type" or identifier in skip or identifier.startswith(VOLATILE_PREFIXES)
+                or prop.type == 'COLLECTION'):
+            continue
+        value = getattr(struct, identifier, None)
+        if prop.type == 'POINTER':
+            if isinstance(value, bpy.types.ID):
+                hasher.update(("%s=<%s>;" % (identifier, value.name)).encode("utf-8"))
+            continue
+        hasher.update(("%s=%r;" % (identifier, hash_value(value))).encode("utf-8"))
+
+
+def hash_foreach(hasher, collection, attribute, size, default=0.0):
+    """Adds one attribute of every item in a bpy collection to a hash
+
+    Args:
+        hasher (hashlib.sha1): The hash to update
+        collection (bpy.types.bpy_prop_collection): e.g. a mesh's vertices
+        attribute (str): The attribute to read, e.g. "co"
+        size (int): The number of values the attribute has for each item
+        default (optional): A value of the attribute's type. Defaults to 0.0.
+    """
+    values = [default] * (len(collection) * size)
+    collection.foreach_get(attribute, values)
+    hasher.update(("%s=%r;" % (attribute, values)).encode("utf-8"))
+
+
+def hash_file(hasher, path):
+    """Adds the contents of a file to a hash
+
+    Files are only read again if their modification time or size changed
+    since they were last hashed.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        hasher.update(("missing=%s;" % path).encode("utf-8"))
+        return
+    file_key = (path, stat.st_mtime, stat.st_size)
+    digest = file_digests.get(file_key)
+    if digest is None:
+        file_hasher = hashlib.sha1()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                file_hasher.update(chunk)
+        digest = file_digests[file_key] = file_hasher.hexdigest()
+    hasher.update(digest.encode("utf-8"))
+
+
+def hash_image(hasher, image):
+    """Adds an image's settings and pixels to a hash
+
+    Packed images are hashed by their packed data, and images that only
+    exist in memory (generated, or painted on and not saved) by their pixels.
+    Anything else is hashed by the contents of its file.
+    """
+    hash_rna(hasher, image)
+    if image is None:
+        return
+    if image.packed_file is not None:
+        hasher.update(image.packed_file.data)
+    elif image.source == 'GENERATED' or image.is_dirty:
+        hasher.update(array('f', image.pixels[:]).tobytes())
+    elif image.source == 'FILE':
+        hash_file(hasher, bpy.path.abspath(image.filepath, library=image.library))
+
+
+def hash_color_ramp(hasher, color_ramp):
+    """Adds a color ramp and its stops to a hash"""
+    hash_rna(hasher, color_ramp)
+    if color_ramp is None:
+        return
+    for element in color_ramp.elements:
+        hasher.update(("%r%r;" % (element.position, tuple(element.color))).encode("utf-8"))
+
+
+def hash_node_tree(hasher, node_tree):
+    """Adds the nodes, their inputs and their links to a hash
+
+    The contents of node groups, and the images of image texture nodes, are
+    hashed as well.
+    """
+    if node_tree is None:
+        return
+    for node in node_tree.nodes:
+        hash_rna(hasher, node)
+        for socket in node.inputs:
+            hasher.update(("%s=%r;" % (socket.identifier,
+                                        hash_value(getattr(socket, "default_value", None)))).encode("utf-8"))
+        if getattr(node, "color_ramp", None) is not None:
+            hash_color_ramp(hasher, node.color_ramp)
+        if getattr(node, "image", None) is not None:
+            hash_image(hasher, node.image)
+        if getattr(node, "node_tree", None) is not None:
+            # Blender doesn't allow a group inside itself, so this always ends
+            hash_node_tree(hasher, node.node_tree)
+    for link in node_tree.links:
+        hasher.update(("%s.%s>%s.%s;" % (link.from_node.name, link.from_socket.identifier,
+                                          link.to_node.name, link.to_socket.identifier)).encode("utf-8"))
+
+
+def hash_texture(hasher, texture):
+    """Adds a texture, and its image, color ramp or nodes, to a hash"""
+    hash_rna(hasher, texture)
+    if texture is None:
+        return
+    if getattr(texture, "image", None) is not None:
+        hash_image(hasher, texture.image)
+    if texture.use_color_ramp:
+        hash_color_ramp(hasher, texture.color_ramp)
+    if texture.use_nodes:
+        hash_node_tree(hasher, texture.node_tree)
+
+
+def hash_texture_slots(hasher, texture_slots):
+    """Adds the texture slots of a material, lamp, world or particle settings to a hash"""
+    for slot in texture_slots:
+        if slot is None:
+            continue
+        hash_rna(hasher, slot)
+        hash_texture(hasher, slot.texture)
+
+
+def hash_material(hasher, material):
+    """Adds a material, its nodes and its textures to a hash"""
+    hash_rna(hasher, material)
+    if material is None:
+        return
+    hash_node_tree(hasher, material.node_tree)
+    hash_texture_slots(hasher, material.texture_slots)
+
+
+def hash_mesh(hasher, mesh):
+    """Adds a mesh's geometry, shading, UVs, vertex colors and materials to a hash"""
+    hash_rna(hasher, mesh)
+    hash_foreach(hasher, mesh.vertices, "co", 3)
+    for polygon in mesh.polygons:
+        hasher.update(("%r%s;" % (tuple(polygon.vertices), polygon.material_index)).encode("utf-8"))
+    hash_foreach(hasher, mesh.polygons, "use_smooth", 1, False)
+    hash_foreach(hasher, mesh.edges, "use_edge_sharp", 1, False)
+    for uv_layer in mesh.uv_layers:
+        hasher.update(uv_layer.name.encode("utf-8"))
+        hash_foreach(hasher, uv_layer.data, "uv", 2)
+    for color_layer in mesh.vertex_colors:
+        hasher.update(color_layer.name.encode("utf-8"))
+        if len(color_layer.data):
+            hash_foreach(hasher, color_layer.data, "color", len(color_layer.data[0].color))
+    if mesh.has_custom_normals:
+        # Custom normals can only be read back through the split normals calculated from them
+        mesh.calc_normals_split()
+        try:
+            hash_foreach(hasher, mesh.loops, "normal", 3)
+        finally:
+            # Hashing shouldn't leave the mesh any different
+            mesh.free_normals_split()
+    for material in mesh.materials:
+        hash_material(hasher, material)
+
+
+def scene_hash(scene):
+    """Returns a hash of the scene data that affects rendering
+
+    This covers the meshes, materials, lamps, world, and render settings. The
+    parts that change from frame to frame (object transforms and poses) are
+    hashed separately by `image_key`.
+
+    Args:
+        scene (bpy.types.Scene): The scene to hash
+
+    Returns:
+        str: A hex digest
+    """
+    hasher = hashlib.sha1()
+    hasher.update(("version=%s;" % CACHE_VERSION).encode("utf-8"))
+    # The output path, border, enabled layers and compositor are all set up by the render task itself
+    hash_rna(hasher, scene.render, {"filepath", "use_border", "use_crop_to_border", "border_min_x", "border_max_x",
+                                    "border_min_y", "border_max_y", "use_persistent_data"})
+    for render_layer in scene.render.layers:
+        hash_rna(hasher, render_layer, {"use"})
+    hash_rna(hasher, scene.world)
+    if scene.world is not None:
+        hash_node_tree(hasher, scene.world.node_tree)
+        hash_texture_slots(hasher, scene.world.texture_slots)
+    if scene.render.engine == 'CYCLES':
+        hash_rna(hasher, scene.cycles)
+    for object in sorted(scene.objects, key=lambda o: o.name):
+        hasher.update(object.name.encode("utf-8"))
+        hash_rna(hasher, object, ANIMATED_PROPERTIES)
+        for modifier in object.modifiers:
+            hash_rna(hasher, modifier)
+            if getattr(modifier, "texture", None) is not None:
+                hash_texture(hasher, modifier.texture)
+        for particle_system in object.particle_systems:
+            hash_rna(hasher, particle_system)
+            hash_rna(hasher, particle_system.settings)
+            hash_texture_slots(hasher, particle_system.settings.texture_slots)
+        if object.type == 'MESH':
+            hash_mesh(hasher, object.data)
+        elif object.type == 'LAMP':
+            hash_rna(hasher, object.data)
+            hash_node_tree(hasher, object.data.node_tree)
+            hash_texture_slots(hasher, object.data.texture_slots)
+        elif object.data is not None:
+            hash_rna(hasher, object.data)
+        for slot in object.material_slots:
+            hash_material(hasher, slot.material)
+    return hasher.hexdigest()
+
+
+def image_key(scene_digest, scene, angle, render_layer, remap, scene_layers, settings, tile=None):
+    """Returns the cache key for the image about to be rendered
+
+    This should be called once the scene is set up for the image (the rig is
+    rotated and the frame is set).
+
+    Args:
+        scene_digest (str): The scene's `scene_hash`
+        scene (bpy.types.Scene): The scene being rendered
+        angle (Angle): The rig angle for this image
+        render_layer (str): The render layer being used
+        remap (int): -1 for mask; 0 for no remap colors; 1, 2, or 3 for remap
+        scene_layers (list[int]): The enabled scene layers
+        settings (PostRenderSettings): The palettization settings
+        tile (tuple[int, int], optional): The (x, y) tile, for objects that
+            are cut up into several tiles
+
+    Returns:
+        str: A hex digest
+    """
+    hasher = hashlib.sha1()
+    hasher.update(("%s;%r;%s;%s;%s;%r;%r;" % (scene_digest, tuple(angle), scene.frame_current, render_layer, remap,
+                                               tuple(scene_layers), tuple(settings[:5]))).encode("utf-8"))
+    if tile is not None:
+        hasher.update(("tile=%r;" % (tuple(tile),)).encode("utf-8"))
+    for object in sorted(scene.objects, key=lambda o: o.name):
+        hasher.update(("%s%r%s;" % (object.name, tuple(tuple(row) for row in object.matrix_world),
+                                    object.hide_render)).encode("utf-8"))
+        if object.pose is not None:
+            for bone in object.pose.bones:
+                hasher.update(repr(tuple(tuple(row) for row in bone.matrix)).encode("utf-8"))
+        shape_keys = getattr(object.data, "shape_keys", None)
+        if shape_keys is not None:
+            hasher.update(repr([key_block.value for key_block in shape_keys.key_blocks]).encode("utf-8"))
+    return hasher.hexdigest()
+
+
+class RenderCache(object):
+    """A content-addressed cache of finished sprites.
+
+    Each sprite is kept as `[key].png` (palette indices), `[key]_preview.png`
+    and `[key].json` (its offset), so several Blender processes can share a
+    cache folder without stepping on each other.
+    """
+
+    def __init__(self, directory):
+        """Creates a new cache
+
+        Args:
+            directory (str): Absolute path to the folder to keep sprites in
+        """
+        self.directory = directory
+
+    def path(self, key, suffix):
+        """Returns the absolute path of one of a sprite's files"""
+        return os.path.join(self.directory, key + suffix)
+
+    def lookup(self, key):
+        """Returns the cached offset of a sprite, or None if it isn't cached
+
+        Args:
+            key (str): The sprite's `image_key`
+
+        Returns:
+            tuple[int, int]: The (x, y) offset of the sprite
+        """
+        if not (os.path.exists(self.path(key, ".png")) and os.path.exists(self.path(key, "_preview.png"))):
+            return None
+        try:
+            with open(self.path(key, ".json")) as offset_file:
+                x, y = json.load(offset_file)
+        except (OSError, ValueError, TypeError):
+            return None
+        return (x, y)
+
+    def restore(self, key, image_path, preview_path):
+        """Copies a cached sprite to where it would have been rendered to"""
+        shutil.copyfile(self.path(key, ".png"), image_path)
+        shutil.copyfile(self.path(key, "_preview.png"), preview_path)
+        # Marks the sprite as recently used, so `prune` keeps it
+        os.utime(self.path(key, ".json"), None)
+
+    def store(self, key, image_path, preview_path, position):
+        """Adds a freshly rendered sprite to the cache
+
+        Args:
+            key (str): The sprite's `image_key`
+            image_path (str): Absolute path to the palette index image
+            preview_path (str): Absolute path to the preview image
+            position (tuple[int, int]): The (x, y) offset of the sprite
+        """
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory, exist_ok=True)
+        shutil.copyfile(image_path, self.path(key, ".png"))
+        shutil.copyfile(preview_path, self.path(key, "_preview.png"))
+        # Written last, so the sprite only counts as cached once it's complete
+        with open(self.path(key, ".json"), "w") as offset_file:
+            json.dump([int(position[0]), int(position[1])], offset_file)
+
+    def prune(self, max_bytes):
+        """Deletes the least recently used sprites until the cache fits in `max_bytes`
+
+        This shouldn't be called while other processes are rendering into the
+        same cache folder.
+
+        Args:
+            max_bytes (int): The most space the cache may take up
+        """
+        if not os.path.isdir(self.directory):
+            return
+        sizes = {}
+        last_used = {}
+        for entry in os.scandir(self.directory):
+            for suffix in ("_preview.png", ".png", ".json"):
+                if entry.name.endswith(suffix):
+                    key = entry.name[:-len(suffix)]
+                    stat = entry.stat()
+                    sizes[key] = sizes.get(key, 0) + stat.st_size
+                    if suffix == ".json":
+                        last_used[key] = stat.st_mtime
+                    break
+        total = sum(sizes.values())
+        # Sprites without a .json were never finished, so they go first
+        for key in sorted(sizes, key=lambda key: last_used.get(key, 0)):
+            if total <= max_bytes:
+                break
+            for suffix in (".json", ".png", "_preview.png"):
+                if os.path.exists(self.path(key, suffix)):
+                    os.remove(self.path(key, suffix))
+            total -= sizes[key]
+
+    def clear(self):
+        """Deletes every cached sprite"""
+        if os.path.exists(self.directory):
+            shutil.rmtree(self.directory)
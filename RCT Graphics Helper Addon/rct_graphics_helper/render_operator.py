@@ -11,6 +11,7 @@ import bpy
 import bpy.utils.previews
 import math
 import os
+import time
 
 from . render_task import *
 from . import json_functions as json_functions
@@ -19,6 +20,9 @@ from bpy.app import driver_namespace
 
 preview_collections = {}  # type: dict[bpy.utils.previews.ImagePreviewCollection]
 
+BORDER_SETTINGS = ("use_border", "use_crop_to_border", "border_min_x", "border_max_x", "border_min_y", "border_max_y")
+"""The render settings that Crop to Objects changes, which are put back once rendering is finished."""
+
 
 def removePreviews():
     """Deletes the preview collect and the previews stored in it"""
@@ -57,9 +61,17 @@ class RCTRender(object):
     """The base class for rendering RCT objects"""
 
     _timer = None
+    step_interval = 0.0  # Seconds between renders, so the next one starts right away
+    poll_interval = 0.25  # Seconds between checks while waiting for something else to finish
+    wait_interval = 0.01  # Seconds between checks while waiting for an adaptive pass to be palettized
     rendering = False
     stop = False
+    failed = False  # Set if some images couldn't be palettized, so no parkobj was made
     renderTask = None  # type: RenderTask
+    persistent_data = False  # The scene's own "Persistent Images" setting, put back when finished
+    border_settings = {}  # The scene's own render border (see BORDER_SETTINGS), put back when finished
+    render_scale = 1  # How many times wider and taller than 256 pixels the render is, for objects that don't fit
+    ortho_scale = 0  # The camera's own orthographic scale, put back when finished
 
     @classmethod
     def poll(cls, context):
@@ -78,12 +90,21 @@ class RCTRender(object):
         """Runs when a blender render is cancelled by the user."""
         self.stop = True
 
+    def set_timer(self, context, interval):
+        """Makes the modal timer fire every [interval] seconds"""
+        if self._timer is not None:
+            if self._timer.time_step == interval:
+                return
+            context.window_manager.event_timer_remove(self._timer)
+        self._timer = context.window_manager.event_timer_add(interval, context.window)
+
     def execute(self, context):
         """Initiates an RCT render."""
         reset_rig()
 
         self.rendering = False
         self.stop = False
+        self.failed = False
 
         if os.path.exists(get_output_path("TMP/")):
             shutil.rmtree(get_output_path("TMP/"))
@@ -91,10 +112,19 @@ class RCTRender(object):
             shutil.rmtree(get_output_path("images/"))
         if os.path.exists(get_output_path("preview/")):
             shutil.rmtree(get_output_path("preview/"))
-        context.scene.render.resolution_x = 256
-        context.scene.render.resolution_y = 256
+        context.scene.render.resolution_x = 256 * self.render_scale
+        context.scene.render.resolution_y = 256 * self.render_scale
         context.scene.render.resolution_percentage = 100
+        # Bigger renders see more of the scene, rather than making the objects bigger
+        self.ortho_scale = context.scene.camera.data.ortho_scale
+        context.scene.camera.data.ortho_scale = self.ortho_scale * self.render_scale
         context.scene.render.alpha_mode = 'TRANSPARENT'
+        set_png_format(context.scene.render.image_settings)
+        self.border_settings = {name: getattr(context.scene.render, name) for name in BORDER_SETTINGS}
+        self.persistent_data = context.scene.render.use_persistent_data
+        if context.scene.render.engine == 'CYCLES':
+            # Only the rig moves between renders, so Cycles can keep the objects' BVH and synced data
+            context.scene.render.use_persistent_data = True
         
         json_functions.add_general_properties_json(context)
         json_functions.json_data.pop("images", None)
@@ -106,23 +136,40 @@ class RCTRender(object):
         handlers.render_pre.append(self.pre)
         handlers.render_post.append(self.post)
         handlers.render_cancel.append(self.cancel)
-        self._timer = context.window_manager.event_timer_add(0.25, context.window)
+        self._timer = None
+        if bpy.app.background:
+            # There's no window to run a modal timer in, so render everything right now
+            while self.renderTask is not None and self.renderTask.status != "FINISHED" and not self.stop:
+                if self.renderTask.step() == "WAITING":
+                    time.sleep(self.wait_interval)
+            self.finished(context)
+            return {"CANCELLED"} if self.failed else {"FINISHED"}
+
+        self.set_timer(context, self.step_interval)
         context.window_manager.modal_handler_add(self)
 
         return {"RUNNING_MODAL"}
 
     def modal(self, context, event):
-        """Runs every [x] seconds while rendering to start the next render"""
+        """Runs on every timer tick while rendering to start the next render"""
         if event.type == 'TIMER':
 
             if self.stop or self.renderTask is None or (self.renderTask.status == "FINISHED" and not self.rendering):
+                if not self.stop and self.renderTask is not None and self.renderTask.post_processing():
+                    # Keep the UI responsive until the last images are palettized
+                    self.set_timer(context, self.poll_interval)
+                    return {"PASS_THROUGH"}
                 self.finished(context)
 
                 return {"FINISHED"}
 
             elif not self.rendering:
-                # render next frame
-                self.renderTask.step()
+                # render next frame, and come straight back for the one after
+                waiting = self.renderTask.step() == "WAITING"
+                self.set_timer(context, self.wait_interval if waiting else self.step_interval)
+
+            else:
+                self.set_timer(context, self.poll_interval)
 
         return {"PASS_THROUGH"}
 
@@ -131,12 +178,36 @@ class RCTRender(object):
         bpy.app.handlers.render_pre.remove(self.pre)
         bpy.app.handlers.render_post.remove(self.post)
         bpy.app.handlers.render_cancel.remove(self.cancel)
-        context.window_manager.event_timer_remove(self._timer)
+        if self._timer is not None:
+            context.window_manager.event_timer_remove(self._timer)
+            self._timer = None
 
         # if os.path.exists(get_output_path("TMP/")):
         #     shutil.rmtree(get_output_path("TMP/"))
 
-        preview_dir_update(context)
-        json_functions.make_parkobj(context)
-
-        reset_rig()
+        try:
+            errors = self.renderTask.finish() if self.renderTask is not None else []
+            if errors:
+                self.failed = True
+                for error in errors:
+                    self.report({'ERROR'}, error)
+                return
+
+            if not bpy.app.background:
+                preview_dir_update(context)
+            if is_shard():
+                # The images are merged with the other shards before making the parkobj
+                json_functions.write_json_file()
+            else:
+                json_functions.make_parkobj(context, self.renderTask.parkobj if self.renderTask is not None else None)
+        finally:
+            if self.renderTask is not None and self.renderTask.parkobj is not None:
+                # Only does anything if the parkobj wasn't finished
+                self.renderTask.parkobj.discard()
+            for name, value in self.border_settings.items():
+                setattr(context.scene.render, name, value)
+            context.scene.render.use_persistent_data = self.persistent_data
+            context.scene.render.resolution_x = 256
+            context.scene.render.resolution_y = 256
+            context.scene.camera.data.ortho_scale = self.ortho_scale
+            reset_rig()
@@ -12,12 +12,24 @@ from enum import Enum
 import bpy
 import math
 import os
-import subprocess
 import shutil
+import traceback
 
 from bpy.types import PARTICLE_PT_velocity
+from bpy_extras.object_utils import world_to_camera_view
+from mathutils import Vector
 from . json_functions import JsonImage
 from . import json_functions
+from . import palettize
+from . gmic_batch import GmicBatch, GmicRunner, parse_offsets
+from . pipeline import PostRenderPipeline, default_worker_count
+from . import render_cache
+
+
+output_directory = "//output/"  # The folder everything is rendered into (may be relative to the .blend)
+shard_index = 0  # Which share of the work this Blender process renders...
+shard_count = 1  # ...out of how many (see `set_shard`)
+cache_directory = None  # The folder finished sprites are cached in. Defaults to `cache` in the output folder
 
 
 def get_res_path(path):
@@ -37,35 +49,65 @@ def get_output_path(path):
     Args:
         path (str): the path of something in the `output` folder
     """
-    rawpath = bpy.path.abspath("//output/" + path)  # type: str
+    rawpath = bpy.path.abspath(output_directory + path)  # type: str
     return rawpath
 
 
-def rename(filename, new_filename):
-    """Renames a file, replacing if the new name already exists
+def set_output_directory(path):
+    """Changes the folder that renders and the parkobj are written to
 
     Args:
-        filename (str): Absolute path to the file
-        new_filename (str): Absolute path with the file's new name
+        path (str): The new output folder. Paths starting with "//" are
+            relative to the .blend file. Defaults to "//output/".
     """
-    filename = os.path.normpath(filename)
-    new_filename = os.path.normpath(new_filename)
-    try:
-        if os.path.exists(new_filename):
-            os.remove(new_filename)
-    except:
-        print("Cannot rename %s, perhaps %s is in use? Continuing with old image" % (
-            bpy.path.relpath(filename), bpy.path.relpath(new_filename)))
-        return
-    os.rename(filename, new_filename)
+    global output_directory
+    output_directory = os.path.join(path, "")
+
+
+def set_shard(index, count):
+    """Makes render tasks in this process only render one share of their images
+
+    The images keep the same numbering as a normal render, so the outputs of
+    all `count` shards can be merged back together afterwards.
+
+    Args:
+        index (int): The shard to render, from 0 to `count` - 1
+        count (int): The number of shards the work is split into
+    """
+    global shard_index, shard_count
+    shard_index = index
+    shard_count = count
+
+
+def set_cache_directory(path):
+    """Changes the folder that finished sprites are cached in
+
+    Args:
+        path (str): Absolute path to the new cache folder, or None to use the
+            `cache` folder in the output folder
+    """
+    global cache_directory
+    cache_directory = path
+
 
+def get_cache_directory():
+    """Returns the absolute path of the folder finished sprites are cached in"""
+    return cache_directory or get_output_path("cache/")
 
-def config_compositor_nodes(render_layer="Normal"):
+
+def is_shard():
+    """Returns True if this process only renders one share of the images"""
+    return shard_count > 1
+
+
+def config_compositor_nodes(render_layer="Normal", in_memory=False):
     """Configures the compositing nodes for separating saving remappable layers
 
     Args:
         render_layer (str, optional): The name of the Render Layer to use for compositing.
         Defaults to "Normal".
+        in_memory (bool, optional): If set, the render goes to a Viewer Node (see
+        `render_to_memory`) instead of being saved by `RCT_RemapOutput`. Defaults to False.
     """
     scene = bpy.context.scene
     scene.use_nodes = True
@@ -86,7 +128,6 @@ def config_compositor_nodes(render_layer="Normal"):
         file_out_node = rct_remap_out.nodes.new(
             'CompositorNodeOutputFile')  # type: bpy.types.CompositorNodeOutputFile
         file_out_node.location = (800, -250)
-        file_out_node.base_path = "//output/TMP/"
         file_out_node.file_slots[0].path = "noremap/"
         for i in range(1, 4):
             file_out_node.file_slots.new("remap%s/" % i)
@@ -120,16 +161,50 @@ def config_compositor_nodes(render_layer="Normal"):
             group_links.new(input=id_node.outputs[0], output=alpha_node.inputs[1])
             group_links.new(input=alpha_node.outputs[0], output=file_out_node.inputs[i])
             
+    file_out_node = rct_remap_out.nodes["File Output"]
+    file_out_node.base_path = output_directory + "TMP/"
+    set_png_format(file_out_node.format)
+
     for node in tree.nodes:
         tree.nodes.remove(node)
     
     render_layers = tree.nodes.new('CompositorNodeRLayers')  # type: bpy.types.CompositorNodeRLayers
+    render_layers.layer = render_layer
+    if in_memory:
+        # Pack the material index into the alpha (as alpha + 2 * index), so one Viewer Node holds everything
+        separate_node = tree.nodes.new('CompositorNodeSepRGBA')  # type: bpy.types.CompositorNodeSepRGBA
+        separate_node.location = (250, 0)
+        multiply_node = tree.nodes.new('CompositorNodeMath')  # type: bpy.types.CompositorNodeMath
+        multiply_node.location = (250, -200)
+        multiply_node.operation = 'MULTIPLY'
+        multiply_node.inputs[1].default_value = 2
+        add_node = tree.nodes.new('CompositorNodeMath')  # type: bpy.types.CompositorNodeMath
+        add_node.location = (450, -100)
+        add_node.operation = 'ADD'
+        combine_node = tree.nodes.new('CompositorNodeCombRGBA')  # type: bpy.types.CompositorNodeCombRGBA
+        combine_node.location = (650, 0)
+        viewer_node = tree.nodes.new('CompositorNodeViewer')  # type: bpy.types.CompositorNodeViewer
+        viewer_node.location = (850, 0)
+        viewer_node.use_alpha = True
+        # Blender won't render with compositing nodes unless there's a Composite node
+        composite_node = tree.nodes.new('CompositorNodeComposite')  # type: bpy.types.CompositorNodeComposite
+        composite_node.location = (850, 200)
+        links.new(render_layers.outputs[0], separate_node.inputs[0])
+        links.new(render_layers.outputs[0], composite_node.inputs[0])
+        links.new(render_layers.outputs.get("IndexMA"), multiply_node.inputs[0])
+        links.new(separate_node.outputs['A'], add_node.inputs[0])
+        links.new(multiply_node.outputs[0], add_node.inputs[1])
+        for i in range(3):
+            links.new(separate_node.outputs[i], combine_node.inputs[i])
+        links.new(add_node.outputs[0], combine_node.inputs[3])
+        links.new(combine_node.outputs[0], viewer_node.inputs[0])
+        tree.nodes.active = viewer_node
+        return
     rct_remap_out_node = tree.nodes.new('CompositorNodeGroup')  # type: bpy.types.CompositorNodeGroup
     rct_remap_out_node.node_tree = rct_remap_out
     rct_remap_out_node.location = (250, 0)
     links.new(render_layers.outputs[0], rct_remap_out_node.inputs[0])
     links.new(render_layers.outputs.get("IndexMA"), rct_remap_out_node.inputs[1])
-    render_layers.layer = render_layer
 
 
 class Angle(namedtuple("Angle", ["rot", "x", "y", "z"])):
@@ -173,9 +248,235 @@ class AngleSection(namedtuple("AngleSection", ["is_diagonal", "num_angles", "x",
         return angles
 
 
+BORDER_MARGIN = 8
+"""Pixels to leave around the objects' projected bounds when cropping a render to them."""
+
+BORDER_OBJECT_TYPES = {'MESH', 'CURVE', 'SURFACE', 'META', 'FONT'}
+"""Object types whose bounds are used to crop renders."""
+
+
+def projected_border(scene, scene_layers):
+    """Works out which part of the render the visible objects can cover
+
+    The corners of each renderable object's bounding box are projected
+    through the scene camera, and the region around them (plus BORDER_MARGIN)
+    is returned. This should be called once the scene is set up for the image
+    (see `RenderTask.apply_state`).
+
+    Args:
+        scene (bpy.types.Scene): The scene being rendered
+        scene_layers (list[int]): The enabled scene layers
+
+    Returns:
+        tuple[float, float, float, float]: (min x, max x, min y, max y) of the
+            region, from 0 to 1 like Blender's render border. None if the whole
+            frame has to be rendered (e.g. for particles or dupli groups, which
+            aren't inside their object's bounding box).
+    """
+    camera = scene.camera
+    xs = []
+    ys = []
+    for object in scene.objects:
+        if object.hide_render or not any(object.layers[i] for i in scene_layers):
+            continue
+        if object.dupli_type != 'NONE' or len(getattr(object, "particle_systems", ())) > 0:
+            return None
+        if object.type not in BORDER_OBJECT_TYPES:
+            continue
+        for corner in object.bound_box:
+            projected = world_to_camera_view(scene, camera, object.matrix_world * Vector(corner))
+            xs.append(projected.x)
+            ys.append(projected.y)
+    if not xs:
+        return None
+    margin_x = BORDER_MARGIN / scene.render.resolution_x
+    margin_y = BORDER_MARGIN / scene.render.resolution_y
+    border = (max(0.0, min(xs) - margin_x), min(1.0, max(xs) + margin_x),
+              max(0.0, min(ys) - margin_y), min(1.0, max(ys) + margin_y))
+    if border[0] >= border[1] or border[2] >= border[3]:
+        return None
+    return border
+
+
+TILE_COLUMN_HEIGHT = 64
+"""Height (in Blender units) of the column above each tile that is cut out of a multi-tile render.
+
+It only has to reach past the top of the render, which is about 6 units tall.
+"""
+
+def convex_hull(points):
+    """Returns the convex hull of some 2D points, in counter-clockwise order (Andrew's monotone chain)"""
+    points = sorted(set(points))
+    if len(points) < 3:
+        return points
+
+    def half(points):
+        hull = []
+        for point in points:
+            while len(hull) >= 2 and ((hull[-1][0] - hull[-2][0]) * (point[1] - hull[-2][1])
+                                      - (hull[-1][1] - hull[-2][1]) * (point[0] - hull[-2][0])) <= 0:
+                hull.pop()
+            hull.append(point)
+        return hull[:-1]
+    return half(points) + half(reversed(points))
+
+
+def tile_location(x, y):
+    """Returns the (x, y) position in Blender of the center of a multi-tile object's tile
+
+    Tiles are 1 unit wide (like the size preview), and tile (0, 0) is centered
+    on the origin. The rig's camera looks along +x and +y, while the game's
+    camera looks along -x and -y, so the object's other tiles go towards -x
+    and -y.
+
+    Args:
+        x (int): The tile's x index, as in the object's `tiles` (x * 32)
+        y (int): The tile's y index, as in the object's `tiles` (y * 32)
+    """
+    return (-x, -y)
+
+
+def tile_columns(scene, x_tiles, y_tiles):
+    """Projects the column above each tile of a multi-tile object through the scene camera
+
+    See `tile_location` for where the tiles are. This should be called once
+    the scene is set up for the image (see `RenderTask.apply_state`).
+
+    Args:
+        scene (bpy.types.Scene): The scene being rendered
+        x_tiles (int): The number of tiles in the x direction
+        y_tiles (int): The number of tiles in the y direction
+
+    Returns:
+        tuple[list, list[tuple[int, int]]]: The columns to pass to
+            `palettize.tile_labels`, and how far each tile's center is from
+            the first tile's center in pixels. Both are in the order of the
+            tiles, with x changing fastest.
+    """
+    camera = scene.camera
+    width = scene.render.resolution_x
+    height = scene.render.resolution_y
+
+    def project(x, y, z):
+        projected = world_to_camera_view(scene, camera, Vector((x, y, z)))
+        return (projected.x * width, (1 - projected.y) * height), projected.z
+
+    # The first tile is where the sprites' offsets are measured from, which isn't quite the render's center
+    (origin_x, origin_y), _ = project(0, 0, 0)
+    columns = []
+    shifts = []
+    for y in range(y_tiles):
+        for x in range(x_tiles):
+            location_x, location_y = tile_location(x, y)
+            corners = [project(location_x + dx, location_y + dy, z)[0] for dx in (-0.5, 0.5) for dy in (-0.5, 0.5)
+                       for z in (0, TILE_COLUMN_HEIGHT)]
+            (center_x, center_y), depth = project(location_x, location_y, 0)
+            columns.append((convex_hull(corners), depth))
+            shifts.append((int(round(center_x - origin_x)), int(round(center_y - origin_y))))
+    return columns, shifts
+
+
+def set_render_border(scene, border):
+    """Limits rendering to part of the frame, while still outputting the whole frame
+
+    Args:
+        scene (bpy.types.Scene): The scene being rendered
+        border (tuple[float, float, float, float]): (min x, max x, min y, max y)
+            from 0 to 1, or None to render the whole frame
+    """
+    render = scene.render
+    render.use_border = border is not None
+    render.use_crop_to_border = False
+    if border is not None:
+        render.border_min_x, render.border_max_x, render.border_min_y, render.border_max_y = border
+
+
+def set_png_format(image_settings):
+    """Makes Blender save 8-bit RGBA PNGs, which is all the palettizer needs
+
+    Args:
+        image_settings (bpy.types.ImageFormatSettings): The settings to change
+    """
+    image_settings.file_format = 'PNG'
+    image_settings.color_mode = 'RGBA'
+    image_settings.color_depth = '8'
+
+
+def render_to_memory(remap, to_srgb=True):
+    """Renders a frame in blender, and returns its images from the Viewer Node instead of saving them
+
+    The compositor has to be set up with `config_compositor_nodes(..., in_memory=True)`.
+
+    Args:
+        remap (int): -1 for mask; 0 for no remap colors; 1, 2, or 3 for remap
+        to_srgb (bool, optional): See `viewer_color_transform`. Defaults to True.
+
+    Returns:
+        list[numpy.ndarray]: The images that would have been saved, as
+            returned by `palettize.viewer_channels`
+    """
+    bpy.ops.render.render()
+    viewer = bpy.data.images["Viewer Node"]
+    width, height = viewer.size
+    return palettize.viewer_channels(viewer.pixels[:], width, height, remap, to_srgb)
+
+
+def viewer_color_transform(scene):
+    """Works out how to match the colors of saved renders when rendering to memory
+
+    The Viewer Node holds linear colors, so the scene's view transform has to
+    be applied afterwards. Only the simple transforms are supported.
+
+    Args:
+        scene (bpy.types.Scene): The scene being rendered
+
+    Returns:
+        bool: True if the sRGB transfer function has to be applied, False if
+            the colors can be used as they are, or None if the scene's color
+            management isn't supported
+    """
+    view_settings = scene.view_settings
+    if (scene.display_settings.display_device != "sRGB" or view_settings.look != "None"
+            or view_settings.exposure != 0 or view_settings.gamma != 1 or view_settings.use_curve_mapping):
+        return None
+    if view_settings.view_transform in ("Default", "Standard"):
+        return True
+    if view_settings.view_transform == "Raw":
+        return False
+    return None
+
+
+def symmetric_angle_index(angles, index, symmetry):
+    """Finds an earlier angle that gives the same view of a rotationally symmetric object
+
+    Only angles without any tilt (x and y of 0) are considered, since the
+    object only looks the same when turned around its vertical axis.
+
+    Args:
+        angles (list[Angle]): The angles being rendered
+        index (int): Index of the angle to check
+        symmetry (int): The object's rotational symmetry in degrees (e.g. 90
+            if it looks the same every quarter turn), or 0 for none
+
+    Returns:
+        int: Index of the earlier angle, or None if this angle has to be rendered
+    """
+    angle = angles[index]
+    if symmetry <= 0 or angle.x != 0 or angle.y != 0:
+        return None
+    for i in range(index):
+        other = angles[i]
+        if other.x != 0 or other.y != 0:
+            continue
+        difference = (angle.rot + angle.z - other.rot - other.z) % symmetry
+        if min(difference, symmetry - difference) < 0.001:
+            return i
+    return None
+
+
 def render(context, filename):
     """Renders a frame in blender, outputting with the given filename"""
-    bpy.data.scenes['Scene'].render.filepath = "//output/TMP/" + filename
+    bpy.data.scenes['Scene'].render.filepath = output_directory + "TMP/" + filename
     bpy.ops.render.render(write_still=True)
     return
 
@@ -256,154 +557,341 @@ def reset_rig():
     rotate_rig((0, 0, 0, 0))
 
 
-def post_render(images_start, total_images, remap, context, offset=(0, 0)):
-    """Runs the post render palettization process
+PostRenderSettings = namedtuple(
+    'PostRenderSettings', 'backend dither_threshold edge_darkening blur_amount dither_method output_path')
+
+
+def get_post_render_settings(context):
+    """Reads the palettization settings from the scene
+
+    Post-processing runs in the background, where `bpy` can't be used, so
+    everything it needs is read up front on the main thread.
+
+    Args:
+        context (bpy.types.Context): bpy context
+
+    Returns:
+        PostRenderSettings: The settings to pass to `post_render`
+    """
+    general_properties = context.scene.rct_graphics_helper_general_properties
+    backend = general_properties.palettize_backend
+    if backend == "numpy" and not palettize.is_available():
+        print("WARNING: NumPy is not available, falling back to G'MIC for palettization")
+        backend = "gmic"
+    return PostRenderSettings(backend, general_properties.dither_threshold, general_properties.edge_darkening, 0,
+                              general_properties.dither_method, get_output_path(""))
+
+
+def remap_output_path(channel, image_index, frame):
+    """Returns where the `RCT_RemapOutput` File Output node writes one channel of an image
+
+    The node's slots are named so that Blender puts the frame number in a
+    known place, so the images never need to be renamed or searched for.
+
+    Args:
+        channel (str): "noremap", "remap1", "remap2" or "remap3"
+        image_index (int): Index of the image
+        frame (int): The animation frame the image was rendered on
+
+    Returns:
+        str: Absolute path to the image
+    """
+    return get_output_path("TMP/%s/%s_%s.png" % (channel, str(image_index).zfill(6), str(frame).zfill(4)))
+
+
+def index_numpy(frames, remap, settings):
+    """Palettizes the rendered images with the NumPy palettizer, without saving them
+
+    Args:
+        frames (list[list[str]]): For each image, the absolute paths of its
+            rendered channels (noremap, remap1, ...), or just its render if
+            `remap` is 0 or -1
+        remap (int): -1 for mask; 0 for no remap colors; 1, 2, or 3 for remap
+        settings (PostRenderSettings): Settings read from the scene
+
+    Returns:
+        tuple[numpy.ndarray, numpy.ndarray]: uint8 array of full palette
+            indices of shape (frames, height, width), and the full palette to
+            preview them with (None for masks)
+    """
+    full_palette = palettize.load_palette(get_res_path("full.png"))
+    no_remap_palette_path = get_res_path("noremap%s.png" % max(remap, 1))
+    no_remap_palette = palettize.load_palette(no_remap_palette_path)
+    channels = list(zip(*frames))
+    stack = palettize.load_frames(channels[0])
+    if remap >= 0:
+        indices, opaque = palettize.index_no_remap(
+            stack, no_remap_palette, settings.dither_threshold, settings.edge_darkening, settings.blur_amount,
+            palettize.load_lut(no_remap_palette_path), settings.dither_method)
+        layers = [(palettize.palette_to_full(no_remap_palette, full_palette)[indices], opaque)]
+        for i in range(1, remap + 1):
+            remap_palette = palettize.load_palette(get_res_path("remap%s.png" % i))
+            indices, opaque = palettize.index_remap(
+                palettize.load_frames(channels[i]), remap_palette,
+                settings.dither_threshold, settings.edge_darkening, settings.blur_amount, settings.dither_method)
+            layers.append((palettize.palette_to_full(remap_palette, full_palette)[indices], opaque))
+        images = palettize.compose(layers, stack.shape[:3])
+    else:
+        images = palettize.mask(stack, 55)
+        full_palette = None
+    return images, full_palette
+
+
+def index_adaptive_pass(frame, previous, remap, settings):
+    """Palettizes one pass of an adaptively sampled image, and compares it to the previous pass
+
+    Args:
+        frame (list[str]): The pass's rendered channels, see `index_numpy`
+        previous (numpy.ndarray): The previous pass's palettized image, or None
+            for the first pass
+        remap (int): -1 for mask; 0 for no remap colors; 1, 2, or 3 for remap
+        settings (PostRenderSettings): Settings read from the scene
+
+    Returns:
+        tuple[numpy.ndarray, int]: The palettized image, and how many of its
+            pixels are different from `previous` (None for the first pass)
+    """
+    indices = index_numpy([frame], remap, settings)[0]
+    return indices, None if previous is None else int((indices != previous).sum())
+
+
+def write_numpy_sprites(images_start, images, full_palette, settings):
+    """Writes indexed images and their previews to the output folders
+
+    Args:
+        images_start (int): Index of the first image
+        images (numpy.ndarray): uint8 array of full palette indices, see `index_numpy`
+        full_palette (numpy.ndarray): The full palette, or None for masks
+        settings (PostRenderSettings): Settings read from the scene
+
+    Returns:
+        list[Offset]: The offset of each image
+    """
+    animation_frames = range(images_start, len(images) + images_start)
+    return palettize.write_sprites(images, [settings.output_path + "images/%s.png" % i for i in animation_frames],
+                                   [settings.output_path + "preview/%s.png" % i for i in animation_frames],
+                                   full_palette)
+
+
+def post_render_numpy(images_start, frames, remap, settings, tiles=None, overlays=()):
+    """Palettizes the rendered images in-process, using the NumPy palettizer
 
     Args:
         images_start (int): Index of the starting image
-        total_images (int): Total number of images to process
+        frames (list[list[str]]): For each image, the absolute paths of its
+            rendered channels (noremap, remap1, ...), or just its render if
+            `remap` is 0 or -1
         remap (int): -1 for mask; 0 for no remap colors; 1, 2, or 3 for remap
-        context (bpy.types.Context): bpy context
+        settings (PostRenderSettings): Settings read from the scene
+        tiles (tuple[list[int], list[tuple]], optional): For a multi-tile
+            object, the index of each tile's first image, and the
+            `tile_columns` of each of `frames`. Every tile's images are cut
+            out of the palettized frames.
+        overlays (list[tuple[int, list[list[str]]]], optional): For each
+            overlay, the index of its first image and its render of each of
+            `frames`. They are drawn over the palettized frames, which are
+            only palettized once for all of them.
+
+    Returns:
+        list[list[Offset]]: The offset of each image, followed by the offset
+            of each tile's images, then of each overlay's images
     """
-    gmic = "gmic"
-    gmic_script_path = get_res_path("remap.gmic")
+    images, full_palette = index_numpy(frames, remap, settings)
+    results = [write_numpy_sprites(images_start, images, full_palette, settings)]
+    if tiles is not None:
+        # The whole object was palettized together, so there are no seams between the tiles
+        tile_starts, frame_columns = tiles
+        labels = palettize.tile_labels([columns for columns, _ in frame_columns], images.shape)
+        for tile, tile_start in enumerate(tile_starts):
+            offsets = write_numpy_sprites(tile_start, palettize.cut_tile(images, labels, tile), full_palette,
+                                          settings)
+            # Each tile's sprite is positioned relative to its own tile
+            results.append([palettize.Offset(offset.x - shifts[tile][0], offset.y - shifts[tile][1])
+                            for offset, (_, shifts) in zip(offsets, frame_columns)])
+    base_opaque = images != 0
+    for overlay_start, overlay_frames in overlays:
+        overlay_images = index_numpy(overlay_frames, remap, settings)[0]
+        composed = palettize.compose([(images, base_opaque), (overlay_images, overlay_images != 0)], images.shape)
+        results.append(write_numpy_sprites(overlay_start, composed, full_palette, settings))
+    return results
+
+
+def post_render_gmic(images_start, frames, remap, settings):
+    """Palettizes the rendered images by running G'MIC with `res/remap.gmic`
+
+    All the frames are handled by a single G'MIC process, which indexes,
+    composes and outputs each of them.
+
+    Args:
+        images_start (int): Index of the starting image
+        frames (list[list[str]]): For each image, the absolute paths of its
+            rendered channels (noremap, remap1, ...), or just its render if
+            `remap` is 0 or -1
+        remap (int): -1 for mask; 0 for no remap colors; 1, 2, or 3 for remap
+        settings (PostRenderSettings): Settings read from the scene
+
+    Returns:
+        list[list[Offset]]: The offset of each image, in a list of its own
+            to match `post_render_numpy`
+    """
+    runner = GmicRunner(get_res_path("remap.gmic"))
     
-    no_remap_palette_path = get_res_path("noremap1.png")
+    no_remap_palette_path = get_res_path("noremap%s.png" % max(remap, 1))
     full_palette_path = get_res_path("full.png")
-    preview_path = get_output_path("preview/")
-    images_path = get_output_path("images/")
-    if not os.path.exists(preview_path):
-        os.mkdir(preview_path)
-    if not os.path.exists(images_path):
-        os.mkdir(images_path)
+    preview_path = settings.output_path + "preview/"
+    images_path = settings.output_path + "images/"
     
-    dither_threshold = context.scene.rct_graphics_helper_general_properties.dither_threshold
-    edge_darkening = context.scene.rct_graphics_helper_general_properties.edge_darkening
-    blur_amount = 0
-    positions = []
+    index_args = '%s,%s,%s' % (settings.dither_threshold, settings.edge_darkening, settings.blur_amount)
+    animation_frames = list(range(images_start, len(frames) + images_start))
+    # Frames should be 8-bit, but scale them down if they were saved as 16-bit anyway
+    scale = 1
+    if frames and palettize.png_bit_depth(frames[0][0]) == 16:
+        print("WARNING: Rendered frames are 16-bit PNGs, expected 8-bit")
+        scale = 257
+    batch = GmicBatch()
     if remap > 0:
-        if remap == 2:
-            no_remap_palette_path = get_res_path("noremap2.png")
-        if remap == 3:
-            no_remap_palette_path = get_res_path("noremap3.png")
-        remap1_palette_path = get_res_path("remap1.png")
-        remap2_palette_path = get_res_path("remap2.png")
-        remap3_palette_path = get_res_path("remap3.png")
-        remap1_images = []
-        remap2_images = []
-        remap3_images = []
-        noremap_images = []
-
-        # Cut off Blender's frame number
-        base_path = get_output_path("TMP/noremap/")
-        old_image_names = os.listdir(base_path)
-        for old_image_name in old_image_names:
-            new_image_path = base_path + old_image_name[:10]
-            rename(base_path + old_image_name, new_image_path)
-            noremap_images.append(new_image_path)
-        # Do the same for all applicable remap images
-        base_path = get_output_path("TMP/remap1/")
-        old_image_names = os.listdir(base_path)
-        for old_image_name in old_image_names:
-            new_image_path = base_path + old_image_name[:10]
-            rename(base_path + old_image_name, new_image_path)
-            remap1_images.append(new_image_path)
-        if remap > 1:
-            base_path = get_output_path("TMP/remap2/")
-            old_image_names = os.listdir(base_path)
-            for old_image_name in old_image_names:
-                new_image_path = base_path + old_image_name[:10]
-                rename(base_path + old_image_name, new_image_path)
-                remap2_images.append(new_image_path)
-            if remap > 2:
-                base_path = get_output_path("TMP/remap3/")
-                old_image_names = os.listdir(base_path)
-                for old_image_name in old_image_names:
-                    new_image_path = base_path + old_image_name[:10]
-                    rename(base_path + old_image_name, new_image_path)
-                    remap3_images.append(new_image_path)
-        
-        # Palettize with gmic...
-        process = subprocess.run([
-            gmic, '-verbose', '0', no_remap_palette_path, *noremap_images, gmic_script_path,
-            'IndexAllNoRemap[^0]', '[0],%s,%s,%s' % (dither_threshold, edge_darkening, blur_amount),
-            '-OutputOffset[^0]', '%s,%s' % (images_start, get_output_path('TMP/noremap/Indexed'))])
-        # print("the commandline is {}".format(subprocess.list2cmdline(process.args)))
-        process = subprocess.run([
-            gmic, '-verbose', '0', remap1_palette_path, *remap1_images, gmic_script_path,
-            'IndexAllRemap[^0]', '[0],%s,%s,%s' % (dither_threshold, edge_darkening, blur_amount),
-            '-OutputOffset[^0]', '%s,%s' % (images_start, get_output_path('TMP/remap1/Indexed'))])
-        if remap > 1:
-            process = subprocess.run([
-                gmic, '-verbose', '0', remap2_palette_path, *remap2_images, gmic_script_path,
-                'IndexAllRemap[^0]', '[0],%s,%s,%s' % (dither_threshold, edge_darkening, blur_amount),
-                '-OutputOffset[^0]', '%s,%s' % (images_start, get_output_path('TMP/remap2/Indexed'))])
-            if remap > 2:
-                process = subprocess.run([
-                    gmic, '-verbose', '0', remap3_palette_path, *remap3_images, gmic_script_path,
-                    'IndexAllRemap[^0]', '[0],%s,%s,%s' % (dither_threshold, edge_darkening, blur_amount),
-                    '-OutputOffset[^0]', '%s,%s' % (images_start, get_output_path('TMP/remap3/Indexed'))])
-
-        for animation_frame in range(images_start, total_images + images_start):
-            indexed_paths = [get_output_path("TMP/noremap/Indexed%s.png" % animation_frame)]
-            indexed_paths.append(get_output_path("TMP/remap1/Indexed%s.png" % animation_frame))
-            if remap > 1:
-                indexed_paths.append(get_output_path("TMP/remap2/Indexed%s.png" % animation_frame))
-                if remap > 2:
-                    indexed_paths.append(get_output_path("TMP/remap3/Indexed%s.png" % animation_frame))
-            out_path = get_output_path("images/%s.png" % animation_frame)
-            preview_image = get_output_path("preview//%s.png" % animation_frame)
-            process = subprocess.run([gmic, '-verbose', '0', full_palette_path, *indexed_paths, gmic_script_path,
-                                     'Compose[^0]', '[0]', '-o[1]', out_path, '-o[2]', preview_image],
-                                     stdout=subprocess.PIPE)
-            # print("the commandline is {}".format(subprocess.list2cmdline(process.args)))
-            a = process.stdout.decode('utf-8')[:-1]
-            positions.extend(a.split('\n'))
+        channels = [("noremap", no_remap_palette_path, 'IndexAllNoRemap[^0]')]
+        for i in range(1, remap + 1):
+            channels.append(("remap%s" % i, get_res_path("remap%s.png" % i), 'IndexAllRemap[^0]'))
+
+        # Palettize each channel...
+        for (name, palette_path, command), images in zip(channels, zip(*frames)):
+            batch.local('', palette_path, *images, '-div[^0]', scale, command, '[0],' + index_args,
+                        '-OutputOffset[^0]', '%s,%s' % (images_start, settings.output_path + 'TMP/%s/Indexed' % name))
+        # ...and then compose them
+        batch.add(full_palette_path)
+        for animation_frame in animation_frames:
+            indexed_paths = [settings.output_path + "TMP/%s/Indexed%s.png" % (name, animation_frame)
+                             for name, _, _ in channels]
+            batch.local('[0]', *indexed_paths, 'Compose[^0]', '[0]',
+                        '-o[1]', images_path + "%s.png" % animation_frame,
+                        '-o[2]', preview_path + "%s.png" % animation_frame)
+        batch.add('-remove')
     
     elif remap == 0:
-        for animation_frame in range(images_start, total_images + images_start):
-            frame = str(animation_frame).zfill(6)
-            image_path = get_output_path("TMP/" + frame + ".png")
-            process = subprocess.run([
-                gmic, '-verbose', '0', full_palette_path, no_remap_palette_path, image_path, gmic_script_path,
-                'IndexAllNoRemap[2]', '[1],{},{},{}'.format(dither_threshold, edge_darkening, blur_amount),
-                'Compose[2]', '[0]', '-o[2]', get_output_path('images/%s.png' % animation_frame), '-o[3]',
-                get_output_path('preview/%s.png' % animation_frame)], stdout=subprocess.PIPE)
-            
-            a = process.stdout.decode('utf-8')[:-1]
-            positions.extend(a.split('\n'))
+        batch.add(full_palette_path, no_remap_palette_path)
+        for animation_frame, (image_path,) in zip(animation_frames, frames):
+            batch.local('[0,1]', image_path, '-div[2]', scale, 'IndexAllNoRemap[2]', '[1],' + index_args, 'Compose[2]', '[0]',
+                        '-o[2]', images_path + '%s.png' % animation_frame,
+                        '-o[3]', preview_path + '%s.png' % animation_frame)
+        batch.add('-remove')
     # Create mask image from alpha
     else:
-        images = []
-        for animation_frame in range(images_start, total_images + images_start):
-            frame = str(animation_frame).zfill(6)
-            images.append(get_output_path("TMP/" + frame + ".png"))
-        process = subprocess.run([
-            gmic, '-verbose', '0', *images, gmic_script_path, '-Mask', '55', '-OutputOffset',
-            '%s,%s' % (images_start, images_path), '-OutputOffset',
-            '%s,%s' % (images_start, preview_path)], stdout=subprocess.PIPE)
-        a = process.stdout.decode('utf-8')[:-1]
-        positions.extend(a.split('\n'))
+        images = [image_path for image_path, in frames]
+        batch.local('', *images, '-div', scale, '-Mask', '55', '-OutputOffset', '%s,%s' % (images_start, images_path))
     
-    json_images = json_functions.json_data.get("images", [])
-    for i in range(total_images):
-        path = "images/%s.png" % (i + images_start)
-        # print("Position %s: %s" % (i + images_start, positions[i]))
-        x, y = positions[i].split(',')
-        json_images.append(JsonImage(path, int(x) + offset[0], int(y) + offset[1]))
+    offsets = parse_offsets(runner.run(batch))
+    if remap < 0:
+        # Masks are their own preview
+        for animation_frame in animation_frames:
+            palettize.link_file(images_path + "%s.png" % animation_frame, preview_path + "%s.png" % animation_frame)
+    return [offsets]
+
+
+def post_render(images_start, frames, remap, settings, tiles=None, overlays=()):
+    """Runs the post render palettization process
 
-    # print(json_images)
-    json_functions.json_data["images"] = json_images
-    # output_path = get_output_path(context, index)
+    This doesn't use `bpy`, so it can run in the background while the next
+    images are being rendered.
+
+    Args:
+        images_start (int): Index of the starting image
+        frames (list[list[str]]): For each image, the absolute paths of its
+            rendered channels (noremap, remap1, ...), or just its render if
+            `remap` is 0 or -1
+        remap (int): -1 for mask; 0 for no remap colors; 1, 2, or 3 for remap
+        settings (PostRenderSettings): Settings read from the scene
+        tiles (tuple[list[int], list[tuple]], optional): For a multi-tile
+            object, the index of each tile's first image, and the
+            `tile_columns` of each of `frames`, which each tile's images are
+            cut out of. Only supported by the NumPy palettizer.
+        overlays (list[tuple[int, list[list[str]]]], optional): For each
+            overlay, the index of its first image and its render of each of
+            `frames`, which it is drawn over. Only supported by the NumPy
+            palettizer.
+
+    Returns:
+        list[list[Offset]]: The offset of each image, followed by the offset
+            of each tile's images, then of each overlay's images
+    """
+    if settings.backend == "numpy":
+        return post_render_numpy(images_start, frames, remap, settings, tiles, overlays)
+    if tiles is not None or overlays:
+        raise ValueError("Cutting out tiles and drawing overlays needs the NumPy palettizer")
+    return post_render_gmic(images_start, frames, remap, settings)
 
 
 RenderTaskSection = namedtuple(
     'RenderTaskSection',
-    'angles remap render_layer scene_layers animation_index animation_count x_tiles y_tiles blank offset')
+    'angles remap render_layer scene_layers animation_index animation_count x_tiles y_tiles blank offset symmetry '
+    'overlays')
+
+Overlay = namedtuple('Overlay', 'render_layer scene_layers image_offset')
+"""A render layer that is rendered on its own for each image of a section, and drawn over that image.
+
+Used for things like a vehicle's riders, so the vehicle itself is only
+rendered once for every set of riders. The render layer should mask the
+overlay with the section's objects (e.g. with `use_zmask`), so only the parts
+in front of them are drawn. image_offset is how many images after each of the
+section's images its overlaid image goes.
+"""
+
+
+def section_render_count(section):
+    """Returns the number of images a RenderTaskSection renders, counting its overlays"""
+    if section.blank:
+        return 1
+    return len(section.angles) * section.animation_count * (1 + len(section.overlays))
+
+
+def section_image_count(section):
+    """Returns the number of images a RenderTaskSection will output"""
+    if section.blank:
+        return 1
+    tiles = section.x_tiles * section.y_tiles
+    # A multi-tile object's renders come first, followed by each tile's images
+    return len(section.angles) * section.animation_count * (1 + tiles if tiles > 1 else 1)
+
+
+def split_section(section):
+    """Splits a RenderTaskSection into one section for each animation frame
+
+    Args:
+        section (RenderTaskSection): The section to split
+
+    Returns:
+        list[tuple[RenderTaskSection, int]]: Each part, and the index of its
+            first image relative to the first image of `section`
+    """
+    if section.blank or section.x_tiles > 1 or section.y_tiles > 1:
+        return [(section, 0)]
+    return [(section._replace(animation_index=section.animation_index + i, animation_count=1), i * len(section.angles))
+            for i in range(section.animation_count)]
+
+
+ADAPTIVE_MIN_SAMPLES = 16
+"""Samples to render the first adaptively sampled image of a section with."""
+
+
+def state_order(section):
+    """Returns the key that `RenderTask.plan` sorts sections by
+
+    Sections are rendered frame by frame, and then grouped by render layer
+    and scene layers, so that the most expensive scene state (the animation
+    frame, and then the compositor) changes as rarely as possible.
+    """
+    if section.blank:
+        return (-1, "", ())
+    return (section.animation_index, section.render_layer, tuple(section.scene_layers))
 
 
 class RenderTaskSectionWorker(object):
-    """Defines a worker that renders an image in a section on each step."""
+    """Defines a worker that renders an image in a section on each step.
+
+    For a multi-tile object, each tile's image is cut out of that render in
+    the same step. If the section has overlays, each of them is rendered in
+    the same step, and drawn over the image as an image of its own.
+    """
     blank = False  # If true, just add a blank image instead of rendering
     
     angles = []  # List of Angles
@@ -414,14 +902,12 @@ class RenderTaskSectionWorker(object):
     anim_index = 0  # Current animation frame
     total_anim = 1  # Total animation frames to render
 
-    x_index = 0  # Current indexes into tile grid
-    y_index = 0  #
     total_x = 1  # Total tiles (x and y)
     total_y = 1  #
 
     images_start = 0  # Starting index to use for images out
     image_index = 0  # Current index to use for an image
-    total_images = 1  # Total images to render
+    total_images = 1  # Total images to render, not counting the tiles' images
 
     status = "CREATED"
     context = None  # type: bpy.context
@@ -431,9 +917,21 @@ class RenderTaskSectionWorker(object):
 
     scene_layers = []
     has_sub_tiles = False
+    symmetry = 0  # Rotational symmetry of the object in degrees, or 0 for none
+
+    render_task = None  # type: RenderTask
+    frames = []  # Rendered images that haven't been sent for post-processing yet
+    overlays = ()  # The section's Overlays
+    overlay_frames = []  # For each overlay, its render of each image in `frames`
+    source_index = 0  # Index of the added section this one was split from
+    frame_columns = []  # For a multi-tile object, the `tile_columns` of each image in `frames`
+    rendering = None  # The image being rendered, while it waits for adaptive passes to be palettized
 
-    def __init__(self, section_in: RenderTaskSection, out_index_start, context):
+    def __init__(self, section_in: RenderTaskSection, out_index_start, context, render_task, source_index=0):
         self.blank = section_in.blank
+        self.render_task = render_task
+        self.frames = []
+        self.source_index = source_index
         self.images_start = out_index_start
         self.image_index = self.images_start
         if not self.blank:
@@ -446,89 +944,279 @@ class RenderTaskSectionWorker(object):
             self.total_x = section_in.x_tiles
             self.total_y = section_in.y_tiles
             self.offset = section_in.offset
+            self.symmetry = section_in.symmetry
+            self.overlays = section_in.overlays
+            self.overlay_frames = [[] for _ in self.overlays]
             self.frame = None
             self.angle_index = 0
             self.total_angles = len(self.angles)
             self.anim_index = self.anim_start
-            self.total_images = self.total_angles * self.total_anim * self.total_x * self.total_y
+            self.total_images = self.total_angles * self.total_anim
             self.status = "CREATED"
             self.context = context
-            self.x_index = 0
-            self.y_index = 0
             self.has_sub_tiles = self.total_x > 1 or self.total_y > 1
-            config_compositor_nodes(self.render_layer)
+            self.frame_columns = []
+            self.rendering = None
 
     def step(self):
         if self.blank:
-            json_images = json_functions.json_data.get("images", [])
-            json_images.append("")
-            json_functions.json_data["images"] = json_images
+            self.render_task.add_blank(self.image_index)
             self.image_index += 1
             self.status = "FINISHED"
             return "FINISHED"
-        if self.angle_index == self.total_angles:
-            self.angle_index = 0
-            self.anim_index += 1
-        if self.anim_index == self.total_anim:
-            self.anim_index = self.anim_start
-            self.x_index += 1
-        if self.has_sub_tiles:
-            if self.x_index == self.total_x:
-                self.x_index = 0
-                self.y_index += 1
-            if self.y_index == self.total_y:
-                self.y_index = 0
-        
-        # print("Current index: %s (going to %s), with %s total images this run" % (
-        #     self.image_index, self.images_start + self.total_images - 1, self.total_images))
+        if self.rendering is None:
+            if self.angle_index == self.total_angles:
+                self.angle_index = 0
+                self.anim_index += 1
+
+            # print("Current index: %s (going to %s), with %s total images this run" % (
+            #     self.image_index, self.images_start + self.total_images - 1, self.total_images))
+
+            # Each tile of a symmetric object looks different, even if the whole object looks the same
+            source = None if self.has_sub_tiles else symmetric_angle_index(self.angles, self.angle_index,
+                                                                           self.symmetry)
+            if source is not None:
+                # This angle looks just like an earlier one, so that image is reused instead
+                self.submit_frames()
+                source_index = self.image_index - self.angle_index + source
+                self.render_task.add_copy(self.image_index, source_index)
+                for overlay in self.overlays:
+                    self.render_task.add_copy(self.image_index + overlay.image_offset,
+                                              source_index + overlay.image_offset)
+                return self.next_image()
+            self.rendering = self.render_image()
+        try:
+            # Stops at each adaptive pass until it has been palettized in the background
+            next(self.rendering)
+            self.status = "WAITING"
+            return "WAITING"
+        except StopIteration:
+            self.rendering = None
+        return self.next_image()
+
+    def next_image(self):
+        """Moves on to the next image once the current one is rendered (or copied)
+
+        Returns:
+            str: "FINISHED" if that was the section's last image, otherwise "RUNNING"
+        """
+        self.angle_index += 1
+        self.image_index += 1
+        finished = self.image_index >= self.total_images + self.images_start
+        # Send each full set of angles off for post-processing while the next ones render
+        if self.angle_index == self.total_angles or finished:
+            self.submit_frames()
+        if finished:
+            # print("Finished: %s out of %s total" % (self.image_index, self.total_images))
+            self.status = "FINISHED"
+            return "FINISHED"
+        self.status = "RUNNING"
+        return "RUNNING"
+
+    def render_image(self):
+        """Sets up the scene for the current image, and renders it (or takes it from the cache)
 
-        # Set up scene for this image
-        rotate_rig(self.angles[self.angle_index])
-        self.context.scene.frame_set(self.anim_index)
+        The tiles' images are cut out of the image, and the overlays are drawn
+        over it, so they are only taken from the cache along with it. This is
+        a generator, which yields whenever it is waiting for an adaptive pass
+        to be palettized (see `render_adaptive`).
+        """
+        angle = self.angles[self.angle_index]
+        self.render_task.apply_state(angle, self.anim_index, self.scene_layers, self.render_layer)
+
+        indices = [self.image_index]
+        keys = [self.render_task.image_key(angle, self.render_layer, self.remap, self.scene_layers)]
+        for tile in range(self.total_x * self.total_y if self.has_sub_tiles else 0):
+            indices.append(self.tile_image_index(tile))
+            keys.append(self.render_task.image_key(angle, self.render_layer, self.remap, self.scene_layers,
+                                                   (tile % self.total_x, tile // self.total_x)))
+        for overlay in self.overlays:
+            indices.append(self.image_index + overlay.image_offset)
+            # The overlay is drawn over this section's image, so it changes whenever that does
+            keys.append(self.render_task.image_key(angle, "%s over %s" % (overlay.render_layer, self.render_layer),
+                                                   self.remap, overlay.scene_layers))
+        if self.render_task.restore_cached(indices, keys, self.offset):
+            # Any frames rendered before this one have to be submitted on their own
+            self.submit_frames()
+            return
+        self.frames.append((yield from self.render_current(self.render_layer, self.scene_layers, self.image_index)))
         if self.has_sub_tiles:
-            pass
-
-        # Set up render
-        self.context.scene.layers = [i in self.scene_layers for i in range(20)]
-        render_layers = self.context.scene.render.layers
-        for layer in render_layers:
-            layer.use = False
-        render_layers.get(self.render_layer).use = True
-        if self.remap > 0:
+            self.frame_columns.append(tile_columns(self.context.scene, self.total_x, self.total_y))
+        for overlay, frames in zip(self.overlays, self.overlay_frames):
+            self.render_task.apply_state(angle, self.anim_index, overlay.scene_layers, overlay.render_layer)
+            frames.append((yield from self.render_current(overlay.render_layer, overlay.scene_layers,
+                                                          self.image_index + overlay.image_offset)))
+        for image_index, key in zip(indices, keys):
+            if key is not None:
+                self.render_task.cache_keys[image_index] = key
+
+    def tile_image_index(self, tile, image_index=None):
+        """Returns the index of a tile's image, cut out of one of the section's images
+
+        Args:
+            tile (int): Index of the tile, with x changing fastest
+            image_index (int, optional): Index of the image it is cut out of.
+                Defaults to the current image.
+        """
+        if image_index is None:
+            image_index = self.image_index
+        return image_index + (tile + 1) * self.total_images
+
+    def render_current(self, render_layer, scene_layers, image_index):
+        """Renders one render layer of the current image, with the scene already set up for it
+
+        This is a generator, like `render_image`, which returns the render.
+
+        Args:
+            render_layer (str): The render layer to render
+            scene_layers (list[int]): The enabled scene layers
+            image_index (int): Index of the image the render is for
+
+        Returns:
+            list: The rendered channels, see `render_frame`
+        """
+        if self.render_task.use_border:
+            set_render_border(self.context.scene, projected_border(self.context.scene, scene_layers))
+        if self.render_task.adaptive_threshold is not None:
+            return (yield from self.render_adaptive(render_layer, image_index))
+        return self.render_frame(render_layer, image_index)
+
+    def render_adaptive(self, render_layer, image_index):
+        """Renders the image with more and more samples, until palettizing it stops changing it
+
+        Each pass doubles the samples, up to the scene's own sample count. The
+        first image of a section starts at ADAPTIVE_MIN_SAMPLES, and the ones
+        after it (in any of its animation frames) start at half of what the
+        last one needed. Each pass is palettized by the render task's
+        pipeline, and this generator yields until it is, so Blender isn't
+        blocked while it waits.
+
+        Args:
+            render_layer (str): The render layer to render
+            image_index (int): Index of the image the render is for
+
+        Returns:
+            list: The image's rendered channels from the last pass, see `render_frame`
+        """
+        cycles = self.context.scene.cycles
+        samples_property = "aa_samples" if cycles.progressive == 'BRANCHED_PATH' else "samples"
+        max_samples = getattr(cycles, samples_property)
+        # Sections are split up by animation frame, so this is the same for every part of the added section
+        samples_key = (self.source_index, render_layer)
+        converged_samples = self.render_task.converged_samples.get(samples_key, 0)
+        samples = min(max_samples, max(ADAPTIVE_MIN_SAMPLES, converged_samples // 2))
+        pipeline = self.render_task.pipeline
+        previous = None
+        try:
+            while True:
+                setattr(cycles, samples_property, samples)
+                frame = self.render_frame(render_layer, image_index)
+                # The next pass would write over this pass's files, so it has to wait for this one anyway
+                job = pipeline.submit(index_adaptive_pass, frame, previous, self.remap, self.render_task.settings)
+                while not pipeline.done(job):
+                    yield
+                if pipeline.error(job) is not None:
+                    raise pipeline.error(job)
+                indices, changed = pipeline.result(job)
+                # Only the last pass is needed, so the passes' images aren't kept until the end
+                pipeline.forget(job)
+                if changed is not None and changed < self.render_task.adaptive_threshold:
+                    break
+                if samples >= max_samples:
+                    break
+                previous = indices
+                samples = min(max_samples, samples * 2)
+        finally:
+            setattr(cycles, samples_property, max_samples)
+        self.render_task.converged_samples[samples_key] = samples
+        return frame
+
+    def render_frame(self, render_layer, image_index):
+        """Renders the image with the scene as it's set up
+
+        Args:
+            render_layer (str): The render layer to render
+            image_index (int): Index of the image the render is for, which
+                names its files
+
+        Returns:
+            list: The image's rendered channels (noremap, remap1, ...), as file
+                paths or arrays
+        """
+        if self.render_task.in_memory:
+            self.context.scene.use_nodes = True
+            return render_to_memory(self.remap, self.render_task.to_srgb)
+        elif self.remap > 0:
             self.context.scene.use_nodes = True
-            self.context.scene.node_tree.nodes.get("Render Layers").layer = self.render_layer
             file_out_node = bpy.data.node_groups.get('RCT_RemapOutput').nodes["File Output"]
-            filename = str(self.image_index).zfill(6) + ".png"
-            file_out_node.file_slots[0].path = "noremap/" + filename
-            file_out_node.file_slots[1].path = "remap1/" + filename
-            file_out_node.file_slots[2].path = "remap2/" + filename
-            file_out_node.file_slots[3].path = "remap3/" + filename
+            filename = str(image_index).zfill(6) + ".png"
+            # Blender replaces the #s with the frame number (see `remap_output_path`)
+            slot_name = str(image_index).zfill(6) + "_####"
+            file_out_node.file_slots[0].path = "noremap/" + slot_name
+            file_out_node.file_slots[1].path = "remap1/" + slot_name
+            file_out_node.file_slots[2].path = "remap2/" + slot_name
+            file_out_node.file_slots[3].path = "remap3/" + slot_name
             render(self.context, filename)
+            channels = ["noremap"] + ["remap%s" % i for i in range(1, self.remap + 1)]
+            return [remap_output_path(channel, image_index, self.anim_index) for channel in channels]
         else:
             self.context.scene.use_nodes = False
-            filename = str(self.image_index).zfill(6) + ".png"
+            filename = str(image_index).zfill(6) + ".png"
             render(self.context, filename)
+            return [get_output_path("TMP/" + filename)]
 
-        self.angle_index += 1
-        self.image_index += 1
-        if self.image_index >= self.total_images + self.images_start:
-            # print("Finished: %s out of %s total" % (self.image_index, self.total_images))
-            post_render(self.images_start, self.total_images, self.remap, self.context, self.offset)
-            self.status = "FINISHED"
-            return "FINISHED"
-        self.status = "RUNNING"
-        return "RUNNING"
+    def submit_frames(self):
+        """Sends the rendered frames that haven't been submitted yet off for post-processing
+
+        The tiles' columns in the frames, and each overlay's renders of them,
+        are sent along with them. The tiles and overlays are palettized in the
+        same jobs as the frames they are cut out of or drawn over.
+        """
+        if self.frames:
+            images_start = self.image_index - len(self.frames)
+            tiles = None
+            if self.has_sub_tiles:
+                tiles = ([self.tile_image_index(tile, images_start) for tile in range(self.total_x * self.total_y)],
+                         self.frame_columns)
+            overlays = [(images_start + overlay.image_offset, frames)
+                        for overlay, frames in zip(self.overlays, self.overlay_frames)]
+            self.render_task.submit(images_start, self.frames, self.remap, self.offset, tiles, overlays)
+            self.frames = []
+            self.frame_columns = []
+            self.overlay_frames = [[] for _ in self.overlays]
 
 
 class RenderTask(object):
     """Defines a list of render "sections" to use for rendering."""
     out_index = 0
+    first_index = 0
     sections = []
+    section_starts = []  # Index of the first image of each section
+    section_sources = []  # For each section, the index of the added section it was split from
     section_index = 0
     status = "CREATED"
     section_task = None
     context = None
     use_antialiasing = False
+    settings = None  # type: PostRenderSettings
+    pipeline = None  # type: PostRenderPipeline
+    workers = 1  # Number of jobs to split each batch of images into
+    # (job, images_start, offset) for each group of images from a post-processing job, where job is
+    # (job index, index into its results), or a list of cached positions; or (None, index, None) for a blank image
+    images = []
+    cache = None  # type: render_cache.RenderCache
+    cache_limit = 0  # The most bytes the cache may take up once rendering is finished
+    scene_digest = ""  # Hash of the scene data, used for cache keys
+    cache_keys = {}  # The cache key of each image that was rendered (rather than taken from the cache)
+    copies = {}  # Index of the image that each symmetric image is a copy of
+    in_memory = False  # If set, renders go straight from the Viewer Node to the palettizer
+    to_srgb = True  # Whether in-memory renders need the sRGB transfer function
+    parkobj = None  # type: json_functions.ParkobjWriter
+    use_border = True  # If set, only the part of each frame that the objects cover is rendered
+    applied = {}  # The scene state set up for the last image, see `apply_state`
+    adaptive_threshold = None  # With adaptive samples, the number of changed pixels that counts as converged
+    converged_samples = {}  # Samples the last adaptively sampled image of each (section, render layer) needed
+    archived = 0  # Number of entries in `images` whose images were added to the parkobj
 
     def __init__(self, context, out_index_start=0):
         """Creates a new RenderTask object
@@ -538,15 +1226,68 @@ class RenderTask(object):
         """
 
         self.out_index = out_index_start
+        self.first_index = out_index_start
         self.sections = []
+        self.section_starts = []
+        self.section_sources = []
         self.section_index = 0
         self.status = "CREATED"
         self.section_task = None
         self.context = context
         self.use_antialiasing = context.scene.render.use_antialiasing
+        self.settings = get_post_render_settings(context)
+        # The workers share the CPUs with Blender's renders, so the default is kept small, and split between shards
+        self.workers = (context.scene.rct_graphics_helper_general_properties.palettize_workers
+                        or default_worker_count(shard_count))
+        # Jobs run in threads, since forking Blender isn't safe. G'MIC runs in its own processes, and NumPy and
+        # zlib let go of the GIL for their big array operations, so the threads still run side by side.
+        self.pipeline = PostRenderPipeline(self.workers)
+        if self.settings.backend == "numpy":
+            # Loaded before any jobs start, so the threads share the same palettes and lookup tables
+            palettize.load_palette(get_res_path("full.png"))
+            for i in range(1, 4):
+                palettize.load_palette(get_res_path("remap%s.png" % i))
+                palettize.load_lut(get_res_path("noremap%s.png" % i))
+        self.images = []
+        self.cache = None
+        if context.scene.rct_graphics_helper_general_properties.use_render_cache:
+            self.cache = render_cache.RenderCache(get_cache_directory())
+        self.cache_limit = context.scene.rct_graphics_helper_general_properties.render_cache_size * 1024 * 1024
+        self.scene_digest = ""
+        self.cache_keys = {}
+        self.copies = {}
+        self.in_memory = False
+        self.to_srgb = True
+        self.parkobj = None
+        if not is_shard():
+            # Shards' images are merged before the parkobj is made
+            self.parkobj = json_functions.ParkobjWriter(
+                get_output_path("%s.parkobj" % context.scene.rct_graphics_helper_general_properties.id))
+        self.archived = 0
+        self.use_border = context.scene.rct_graphics_helper_general_properties.use_render_border
+        self.applied = {}
+        self.adaptive_threshold = None
+        self.converged_samples = {}
+        if context.scene.rct_graphics_helper_general_properties.use_adaptive_samples:
+            if context.scene.render.engine != 'CYCLES':
+                print("WARNING: Adaptive samples only work with Cycles, rendering with all samples instead")
+            elif self.settings.backend != "numpy":
+                print("WARNING: Adaptive samples need the NumPy palettizer, rendering with all samples instead")
+            else:
+                self.adaptive_threshold = context.scene.rct_graphics_helper_general_properties.adaptive_threshold
+        if context.scene.rct_graphics_helper_general_properties.use_memory_frames:
+            self.to_srgb = viewer_color_transform(context.scene)
+            if self.settings.backend != "numpy":
+                print("WARNING: Rendering to memory needs the NumPy palettizer, saving frames to disk instead")
+            elif self.to_srgb is None:
+                print("WARNING: Rendering to memory needs the Default, Standard or Raw view transform (with no "
+                      "look, exposure, gamma or curves), saving frames to disk instead")
+            else:
+                self.in_memory = True
 
     def add(self, angles=[Angle(0, 0, 0, 0)], remap=0, render_layer="", scene_layers=[0, 10],
-            animation_frame_index=0, animation_frame_count=1, x_tiles=1, y_tiles=1, blank=False, offset=(0, 0)):
+            animation_frame_index=0, animation_frame_count=1, x_tiles=1, y_tiles=1, blank=False, offset=(0, 0),
+            symmetry=0, overlays=()):
         """Adds a render task section
 
         Args:
@@ -561,26 +1302,114 @@ class RenderTask(object):
             x_tiles (int, optional): (for large scenery) The number of tiles in the x direction
                 to render. Defaults to 1.
             y_tiles (int, optional): (for large scenery) The number of tiles in the y direction
-                to render. Defaults to 1.
+                to render. Defaults to 1. With more than one tile, the images of the whole object
+                come first, followed by each tile's images (with x changing fastest), which are cut
+                out of them. Only supported by the NumPy palettizer.
             blank (boolean, optional): If set, all other options are ignored and a blank image is
                 added instead.
+            offset (tuple[int, int], optional): Added to the offset of each image. Defaults to (0, 0).
+            symmetry (int, optional): The object's rotational symmetry in degrees (e.g. 90 if it looks
+                the same every quarter turn). Angles that give the same view are only rendered once.
+                Defaults to 0 (no symmetry).
+            overlays (list[Overlay], optional): Render layers to render for each image, and draw
+                over it as images of their own. Only supported by the NumPy palettizer. Defaults to
+                none.
         """
         
         self.sections.append(
             RenderTaskSection(angles, remap, render_layer, scene_layers,
-                              animation_frame_index, animation_frame_count, x_tiles, y_tiles, blank, offset))
+                              animation_frame_index, animation_frame_count, x_tiles, y_tiles, blank, offset,
+                              symmetry, tuple(overlays)))
+
+    def plan(self):
+        """Works out where each section's images start, and the order to render them in
+
+        Sections are split up by animation frame. When rendering a shard, each
+        part is given to whichever shard has the fewest images so far, and
+        only this process's parts are kept. The parts are then sorted by
+        `state_order`. Each part keeps the index of its first image, so the
+        output is the same whatever order they're rendered in.
+        """
+        parts = []
+        index = self.first_index
+        for source, section in enumerate(self.sections):
+            parts.extend((part, index + part_start, source) for part, part_start in split_section(section))
+            index += section_image_count(section)
+        if self.cache is not None:
+            self.scene_digest = render_cache.scene_hash(self.context.scene)
+            if self.adaptive_threshold is not None:
+                # Adaptively sampled sprites aren't the same as ones rendered with all the samples
+                self.scene_digest += "-adaptive%s" % self.adaptive_threshold
+        if is_shard():
+            shard_parts = []
+            loads = [0] * shard_count
+            for part in parts:
+                shard = loads.index(min(loads))
+                loads[shard] += section_render_count(part[0])
+                if shard == shard_index:
+                    shard_parts.append(part)
+            parts = shard_parts
+        parts.sort(key=lambda part: state_order(part[0]))
+        self.sections = [section for section, _, _ in parts]
+        self.section_starts = [start for _, start, _ in parts]
+        self.section_sources = [source for _, _, source in parts]
+
+    def apply_state(self, angle, frame, scene_layers, render_layer):
+        """Sets up the scene for an image, only changing what is different from the last image
+
+        The scene is always updated afterwards, so every object's matrices are
+        the ones it will be rendered with.
+
+        Args:
+            angle (Angle): The rig angle
+            frame (int): The animation frame
+            scene_layers (list[int]): The scene layers to enable
+            render_layer (str): The render layer to use
+        """
+        scene = self.context.scene
+        applied = self.applied
+        if applied.get("compositor") != self.in_memory:
+            config_compositor_nodes(render_layer, self.in_memory)
+        elif applied.get("render_layer") != render_layer:
+            # Switching the Render Layers node is enough, so overlays don't rebuild the tree for every image
+            scene.node_tree.nodes.get("Render Layers").layer = render_layer
+        if applied.get("angle") != angle:
+            rotate_rig(angle)
+        # Setting the frame re-evaluates the whole scene, even if it's the same frame
+        if applied.get("frame") != frame:
+            scene.frame_set(frame)
+        elif applied.get("angle") != angle:
+            # Rotating the rig doesn't move the camera and lamps parented to it until the scene is updated,
+            # and the cache key needs their new matrices
+            scene.update()
+        layers = [i in scene_layers for i in range(20)]
+        if list(scene.layers) != layers:
+            scene.layers = layers
+        if applied.get("render_layer") != render_layer:
+            for layer in scene.render.layers:
+                layer.use = layer.name == render_layer
+        self.applied = {"compositor": self.in_memory, "angle": angle, "frame": frame,
+                        "render_layer": render_layer}
 
     def step(self):
+        if self.status == "CREATED":
+            self.plan()
+            self.status = "RUNNING"
         if self.section_task is None:
             # print(self.sections)
-            if self.sections == []:
+            if self.section_index == len(self.sections):
                 self.status = "FINISHED"
                 return "FINISHED"
             section = self.sections[self.section_index]
-            self.section_task = RenderTaskSectionWorker(section, self.out_index, self.context)
+            self.out_index = self.section_starts[self.section_index]
+            self.section_task = RenderTaskSectionWorker(section, self.out_index, self.context, self,
+                                                        self.section_sources[self.section_index])
 
         result = self.section_task.step()
         self.out_index = self.section_task.image_index
+        self.archive_finished()
+        if result == "WAITING":
+            return "WAITING"
 
         if result == "FINISHED":
             self.section_task = None
@@ -589,3 +1418,176 @@ class RenderTask(object):
             if self.section_index == len(self.sections):
                 self.status = "FINISHED"
                 return "FINISHED"
+
+    def submit(self, images_start, frames, remap, offset=(0, 0), tiles=None, overlays=()):
+        """Queues rendered images to be palettized in the background
+
+        Args:
+            images_start (int): Index of the first image
+            frames (list[list[str]]): For each image, the absolute paths of
+                its rendered channels, as passed to `post_render`
+            remap (int): -1 for mask; 0 for no remap colors; 1, 2, or 3 for remap
+            offset (tuple[int, int], optional): Added to each image's offset.
+                Defaults to (0, 0).
+            tiles (tuple[list[int], list[tuple]], optional): For a
+                multi-tile object, the index of each tile's first image, and
+                the `tile_columns` of each of `frames`
+            overlays (list[tuple[int, list[list[str]]]], optional): For each
+                overlay, the index of its first image and its render of each
+                of `frames`, which it is drawn over
+        """
+        self.make_output_folders()
+        # Every image is palettized on its own, so the batch can be split between the workers
+        chunk_size = max(1, -(-len(frames) // self.workers))
+        for start in range(0, len(frames), chunk_size):
+            end = start + chunk_size
+            job = self.pipeline.submit(post_render, images_start + start, frames[start:end], remap, self.settings,
+                                       ([tile_start + start for tile_start in tiles[0]], tiles[1][start:end])
+                                       if tiles is not None else None,
+                                       [(overlay_start + start, overlay_frames[start:end])
+                                        for overlay_start, overlay_frames in overlays])
+            # The job's results are the images' offsets, followed by each tile's, then each overlay's
+            starts = [images_start] + (tiles[0] if tiles is not None else []) + [
+                overlay_start for overlay_start, _ in overlays]
+            for part, part_start in enumerate(starts):
+                self.images.append(((job, part), part_start + start, offset))
+
+    def make_output_folders(self):
+        """Creates the `images` and `preview` output folders if they don't exist yet"""
+        for path in (get_output_path("preview/"), get_output_path("images/")):
+            if not os.path.exists(path):
+                os.mkdir(path)
+
+    def image_key(self, angle, render_layer, remap, scene_layers, tile=None):
+        """Returns the cache key for the image about to be rendered, or None if the cache isn't used"""
+        if self.cache is None:
+            return None
+        return render_cache.image_key(self.scene_digest, self.context.scene, angle, render_layer, remap,
+                                      scene_layers, self.settings, tile)
+
+    def restore_cached(self, image_indices, keys, offset=(0, 0)):
+        """Copies cached sprites into the output instead of rendering them
+
+        The sprites are all made from the same render, so nothing is copied
+        unless every one of them is cached.
+
+        Args:
+            image_indices (list[int]): Index of each image
+            keys (list[str]): Each image's cache key, or None
+            offset (tuple[int, int], optional): Added to each image's offset.
+                Defaults to (0, 0).
+
+        Returns:
+            bool: True if the sprites were all cached, and don't need rendering
+        """
+        if None in keys:
+            return False
+        positions = [self.cache.lookup(key) for key in keys]
+        if None in positions:
+            return False
+        self.make_output_folders()
+        for image_index, key, position in zip(image_indices, keys, positions):
+            self.cache.restore(key, get_output_path("images/%s.png" % image_index),
+                               get_output_path("preview/%s.png" % image_index))
+            self.images.append(([position], image_index, offset))
+        return True
+
+    def add_copy(self, image_index, source_index):
+        """Adds an image that is the same as an earlier image, instead of rendering it
+
+        Args:
+            image_index (int): Index of the image
+            source_index (int): Index of the earlier image to reuse
+        """
+        self.copies[image_index] = source_index
+
+    def add_blank(self, image_index):
+        """Adds a blank image, keeping its place among the submitted images"""
+        self.images.append((None, image_index, None))
+
+    def store_cached(self, images_start, positions):
+        """Adds freshly rendered sprites to the cache"""
+        for i, position in enumerate(positions):
+            key = self.cache_keys.get(images_start + i)
+            if key is not None:
+                self.cache.store(key, get_output_path("images/%s.png" % (images_start + i)),
+                                 get_output_path("preview/%s.png" % (images_start + i)), position)
+
+    def archive_finished(self):
+        """Adds the images that are done being palettized to the parkobj, in order
+
+        Stops at the first job that is still running, so images are archived in
+        the same order that they were rendered. Jobs that failed are skipped
+        (`finish` reports them).
+        """
+        if self.parkobj is None:
+            return
+        while self.archived < len(self.images):
+            job, images_start, offset = self.images[self.archived]
+            if isinstance(job, tuple):
+                job_index, part = job
+                if not self.pipeline.done(job_index):
+                    return
+                result = self.pipeline.result(job_index)
+                positions = result[part] if result is not None else []
+            else:
+                positions = job or []
+            for i in range(len(positions)):
+                self.parkobj.add_image("images/%s.png" % (images_start + i))
+            self.archived += 1
+
+    def post_processing(self):
+        """Returns True if images are still being palettized in the background"""
+        self.archive_finished()
+        return self.pipeline.pending() > 0
+
+    def finish(self):
+        """Waits for the background palettization to finish, and adds the images to the json data
+
+        Returns:
+            list[str]: A message for each batch of images that couldn't be
+                palettized. If there are any, the json data is left unchanged.
+        """
+        if self.section_task is not None and self.section_task.rendering is not None:
+            # Puts the scene's samples back if rendering stopped during adaptive sampling
+            self.section_task.rendering.close()
+        results = self.pipeline.drain()
+        errors = []
+        json_images = list(json_functions.json_data.get("images", []))
+        base = len(json_images) - self.first_index
+        for job, images_start, offset in self.images:
+            if job is None:
+                entries = [""]
+            else:
+                if isinstance(job, tuple) and self.pipeline.error(job[0]) is not None:
+                    error = self.pipeline.error(job[0])
+                    if job[1] == 0:
+                        # Reported once for the whole job, not for each of its groups of images
+                        traceback.print_exception(type(error), error, error.__traceback__)
+                        errors.append("Palettizing image %s onwards failed: %s" % (images_start, error))
+                    continue
+                # Jobs are an index into the pipeline's results, or a list of cached positions
+                positions = results[job[0]][job[1]] if isinstance(job, tuple) else job
+                entries = [JsonImage("images/%s.png" % (i + images_start), x + offset[0], y + offset[1])
+                           for i, (x, y) in enumerate(positions)]
+                if isinstance(job, tuple):
+                    self.store_cached(images_start, positions)
+            for i, entry in enumerate(entries):
+                # When rendering a shard, the other shards' images are left as None
+                position = base + images_start + i
+                json_images.extend([None] * (position + 1 - len(json_images)))
+                json_images[position] = entry
+        if errors:
+            return errors
+        for image_index, source_index in sorted(self.copies.items()):
+            # Copies share their source's image (and offset, since they're in the same section)
+            position = base + image_index
+            json_images.extend([None] * (position + 1 - len(json_images)))
+            json_images[position] = dict(json_images[base + source_index])
+            palettize.link_file(get_output_path("preview/%s.png" % source_index),
+                                get_output_path("preview/%s.png" % image_index))
+        json_functions.json_data["images"] = json_images
+        if self.cache is not None and not is_shard():
+            # Shards share the cache, so it's only pruned once they're all finished (see batch_render.py)
+            self.cache.prune(self.cache_limit)
+        return []
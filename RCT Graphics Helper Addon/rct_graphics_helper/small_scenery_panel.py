@@ -78,6 +78,10 @@ def update_shape(self, context):
     objects = bpy.data.objects
     scene = bpy.context.scene
     custom_properties.update_height(self, context)
+    # Large scenery stretches the size preview over all of its tiles
+    full_tile = objects.get("RCT_Full_Tile")
+    full_tile.scale = (1, 1, full_tile.scale[2])
+    full_tile.location = (0, 0, 0)
     if shape != "4/4":
         properties.SMALL_SCENERY_FLAG_VOFFSET_CENTRE = False
         properties.prohibitWalls = False
@@ -274,6 +278,7 @@ def add_small_scenery_properties_json(context):
     """Processes small scenery properties and adds them to the global JSON"""
     json_properties = json_functions.group_as_dict(context.scene.rct_graphics_helper_small_scenery_properties)
     json_properties.pop("frameOffsets_index", None)
+    json_properties.pop("symmetry", None)
     if json_properties.get("hasGlass", None):
         json_properties.pop("isAnimated", None)
     if not json_properties.get("isAnimated", None):
@@ -392,28 +397,30 @@ class RenderSmallScenery(RCTRender, bpy.types.Operator):
         add_small_scenery_properties_json(context)
         # print("JSON data:\n%s" % json_functions.json_data)
         angles = AngleSection(False, 4, 0, 0, 0).angles
+        symmetry = custom_properties.symmetry_degrees[self.small_scenery_properties.symmetry]
         if not self.small_scenery_properties.isAnimated:
             remap = 0
             if self.small_scenery_properties.hasSecondaryColour:
                 remap = 2
             elif self.small_scenery_properties.hasPrimaryColour:
                 remap = 1
-            self.renderTask.add(angles, remap, "Normal", [0, 10])
+            self.renderTask.add(angles, remap, "Normal", [0, 10], symmetry=symmetry)
             if self.small_scenery_properties.hasGlass:
-                self.renderTask.add(angles, -1, "Glass", [0, 1, 10])
+                self.renderTask.add(angles, -1, "Glass", [0, 1, 10], symmetry=symmetry)
         elif self.small_scenery_properties.animation_type == "use_frame_offsets":
             remap = 0
             if self.small_scenery_properties.hasSecondaryColour:
                 remap = 2
             elif self.small_scenery_properties.hasPrimaryColour:
                 remap = 1
-            self.renderTask.add(angles, remap, "Normal", [0, 10], 0, context.scene.frame_end)
+            self.renderTask.add(angles, remap, "Normal", [0, 10], 0, context.scene.frame_end, symmetry=symmetry)
         return super().execute(context)
 
     def finished(self, context):
         """Runs when rendering is completely finished."""
         super().finished(context)
-        self.report({'INFO'}, 'RCT Small Scenery render finished.')
+        if not self.failed:
+            self.report({'INFO'}, 'RCT Small Scenery render finished.')
 
 
 class SmallSceneryProperties(bpy.types.PropertyGroup):
@@ -424,6 +431,7 @@ class SmallSceneryProperties(bpy.types.PropertyGroup):
     cursor = custom_properties.cursor
     price = custom_properties.price
     removalPrice = custom_properties.removalPrice
+    symmetry = custom_properties.symmetry
     sceneryGroup = bpy.props.StringProperty(
         name="Group ID",
         description="OpenRCT2 id of the primary scenery group this object should be included in.")
@@ -671,6 +679,7 @@ class SmallSceneryPanel(bpy.types.Panel):
 
         row = layout.row()
         row.prop(small_scenery_properties, "sceneryGroup")
+        row.prop(small_scenery_properties, "symmetry")
 
         row = layout.row(align=True)
         row.prop(small_scenery_properties, "hasPrimaryColour", toggle=True)
@@ -52,7 +52,11 @@ def update_stall(self, context: bpy.types.Context):
     else:
         properties.height = 64
     
-    objects.get("RCT_Full_Tile").hide = False
+    # Large scenery stretches the size preview over all of its tiles
+    full_tile = objects.get("RCT_Full_Tile")
+    full_tile.hide = False
+    full_tile.scale = (1, 1, full_tile.scale[2])
+    full_tile.location = (0, 0, 0)
     objects.get("RCT_One_Quarter").hide = True
     objects.get("RCT_Diagonal_1").hide = True
     objects.get("RCT_Diagonal_2").hide = True
@@ -200,7 +204,8 @@ class RenderStall(RCTRender, bpy.types.Operator):
     def finished(self, context):
         """Runs when rendering is completely finished."""
         super().finished(context)
-        self.report({'INFO'}, 'RCT Stall render finished.')
+        if not self.failed:
+            self.report({'INFO'}, 'RCT Stall render finished.')
 
 
 shop_items = [
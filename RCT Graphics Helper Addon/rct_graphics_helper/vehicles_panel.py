@@ -14,6 +14,45 @@ import os
 from . render_operator import RCTRender
 from . track import track_angle_sections, track_angle_sections_names
 from . render_task import *
+from . import custom_properties as custom_properties
+
+
+def update_vehicle_render_layers(scene, properties, overlays):
+    """Sets up a render layer for the vehicle, and one for each set of riders
+
+    The vehicle is on scene layer 0, and each set of riders on its own layer
+    from 1 up.
+
+    Args:
+        scene (bpy.types.Scene): The scene being rendered
+        properties (VehicleProperties): The vehicle properties
+        overlays (bool): If set, the rider layers only render the riders,
+            masked by the vehicle (see `Overlay`). Otherwise they render the
+            vehicle along with the riders.
+    """
+    names = ["Vehicle"] + ["Riders %s" % i for i in range(1, properties.number_of_rider_sets + 1)]
+    render_layers = scene.render.layers
+    for name in names:
+        if render_layers.get(name) is None:
+            render_layers.new(name)
+    for render_layer in render_layers:
+        if render_layer.name not in names:
+            render_layers.remove(render_layer)
+    layer_vehicle = render_layers.get("Vehicle")
+    layer_vehicle.layers = [i == 0 or i == 10 for i in range(20)]
+    layer_vehicle.use_zmask = False
+    layer_vehicle.use_pass_material_index = True
+    for rider_set in range(1, properties.number_of_rider_sets + 1):
+        layer_riders = render_layers.get("Riders %s" % rider_set)
+        layer_riders.layers = [(i == 0 and not overlays) or i == rider_set or i == 10 for i in range(20)]
+        layer_riders.use_zmask = overlays
+        layer_riders.layers_zmask = [i == 0 and overlays for i in range(20)]
+        layer_riders.use_pass_material_index = True
+
+
+def inverted_angles(angles):
+    """Returns the angles for an inverted set, with the vehicle rolled upside down"""
+    return [Angle(angle.rot, angle.x, angle.y + 180, angle.z) for angle in angles]
 
 
 class RenderVehicle(RCTRender, bpy.types.Operator):
@@ -35,59 +74,99 @@ class RenderVehicle(RCTRender, bpy.types.Operator):
                 return self.props.sprite_track_flags[i]
             i += 1
 
-    def append_angles_to_rendertask(self, render_layer, inverted):
+    def append_angles(self, sections, inverted):
+        """Adds the angles of each track piece to render to `sections`
+
+        Args:
+            sections (list[tuple[list[Angle], int, int]]): The angles, first
+                animation frame and animation frame count of each section
+            inverted (bool): If set, adds the inverted set's angles instead
+        """
         start_anim = 0
-        if self.scene.rct_graphics_helper_general_properties.number_of_animation_frames != 1:
+        if self.props.number_of_animation_frames != 1:
             start_anim = 4
-        anim_count = self.scene.rct_graphics_helper_general_properties.number_of_animation_frames
+        anim_count = self.props.number_of_animation_frames
         for i in range(len(track_angle_sections_names)):
             key = track_angle_sections_names[i]
             track_section = track_angle_sections[key]
             if self.key_is_property(key):
-                if self.property_value(key):
-                    self.renderTask.add(
-                        track_section, render_layer, inverted, start_anim, anim_count)
+                enabled = self.property_value(key)
             elif (key == "VEHICLE_SPRITE_FLAG_GENTLE_SLOPE_BANKED_TURNS"
                     or key == "VEHICLE_SPRITE_FLAG_GENTLE_SLOPE_BANKED_TRANSITIONS"):
-                if self.property_value("SLOPED_TURNS"):
-                    self.renderTask.add(
-                        track_section, render_layer, inverted, start_anim, anim_count)
+                enabled = self.property_value("SLOPED_TURNS")
             elif key == "VEHICLE_SPRITE_FLAG_FLAT_TO_GENTLE_SLOPE_WHILE_BANKED_TRANSITIONS":
-                if self.property_value("SLOPED_TURNS") and self.property_value("VEHICLE_SPRITE_FLAG_FLAT_BANKED"):
-                    self.renderTask.add(
-                        track_section, render_layer, inverted, start_anim, anim_count)
+                enabled = self.property_value("SLOPED_TURNS") and self.property_value("VEHICLE_SPRITE_FLAG_FLAT_BANKED")
             elif key == "VEHICLE_SPRITE_FLAG_DIAGONAL_GENTLE_SLOPE_BANKED_TRANSITIONS":
-                if self.property_value("SLOPED_TURNS") and self.property_value("VEHICLE_SPRITE_FLAG_DIAGONAL_SLOPES"):
-                    self.renderTask.add(
-                        track_section, render_layer, inverted, start_anim, anim_count)
+                enabled = (self.property_value("SLOPED_TURNS")
+                           and self.property_value("VEHICLE_SPRITE_FLAG_DIAGONAL_SLOPES"))
             elif key == "VEHICLE_SPRITE_FLAG_FLAT_TO_GENTLE_SLOPE_BANKED_TRANSITIONS":
-                if (self.property_value("VEHICLE_SPRITE_FLAG_FLAT_BANKED")
-                        and self.property_value("VEHICLE_SPRITE_FLAG_GENTLE_SLOPES")):
-                    self.renderTask.add(
-                        track_section, render_layer, inverted, start_anim, anim_count)
+                enabled = (self.property_value("VEHICLE_SPRITE_FLAG_FLAT_BANKED")
+                           and self.property_value("VEHICLE_SPRITE_FLAG_GENTLE_SLOPES"))
             elif key == "VEHICLE_SPRITE_FLAG_RESTRAINT_ANIMATION" and inverted is False:
+                # The restraint animation is its own 3 frames, starting at frame 1
                 if self.props.restraint_animation:
-                    self.renderTask.add(
-                        track_section, render_layer, inverted, 1, 3)
+                    sections.extend((angle_section.angles, 1, 3) for angle_section in track_section)
+                continue
+            else:
+                enabled = False
+            if enabled:
+                for angle_section in track_section:
+                    angles = angle_section.angles
+                    if inverted:
+                        angles = inverted_angles(angles)
+                    sections.append((angles, start_anim, anim_count))
 
     def execute(self, context):
         self.scene = context.scene
         self.props = self.scene.rct_graphics_helper_vehicle_properties
 
-        self.renderTask = RenderTask(
-            context.scene.rct_graphics_helper_general_properties.out_start_index, context)
-
-        for i in range(context.scene.rct_graphics_helper_general_properties.number_of_rider_sets + 1):
-            self.append_angles_to_rendertask(i, False)
-
-            if self.props.inverted_set:
-                self.append_angles_to_rendertask(i, True)
+        overlays = self.props.use_rider_overlays and self.props.number_of_rider_sets > 0
+        if overlays and get_post_render_settings(context).backend != "numpy":
+            print("WARNING: Rendering riders separately needs the NumPy palettizer, rendering the whole vehicle "
+                  "for every rider set instead")
+            overlays = False
+        if overlays and context.scene.render.engine != 'BLENDER_RENDER':
+            # Only Blender Render can mask a render layer with another layer's objects
+            print("WARNING: Rendering riders separately needs Blender Render, rendering the whole vehicle for "
+                  "every rider set instead")
+            overlays = False
+        update_vehicle_render_layers(self.scene, self.props, overlays)
+        self.renderTask = RenderTask(context)
+
+        remap = 0
+        if self.props.hasTernaryColour:
+            remap = 3
+        elif self.props.hasSecondaryColour:
+            remap = 2
+        elif self.props.hasPrimaryColour:
+            remap = 1
+        sections = []
+        self.append_angles(sections, False)
+        if self.props.inverted_set:
+            self.append_angles(sections, True)
+        # Each rider set's images are a copy of the vehicle's images, following on after them
+        rider_set_images = sum(len(angles) * anim_count for angles, _, anim_count in sections)
+        rider_sets = range(1, self.props.number_of_rider_sets + 1)
+
+        if overlays:
+            # The vehicle is only rendered once, and each set of riders is drawn over it
+            rider_overlays = [Overlay("Riders %s" % i, [0, i, 10], i * rider_set_images) for i in rider_sets]
+            for angles, start_anim, anim_count in sections:
+                self.renderTask.add(angles, remap, "Vehicle", [0, 10], start_anim, anim_count,
+                                    overlays=rider_overlays)
+        else:
+            for angles, start_anim, anim_count in sections:
+                self.renderTask.add(angles, remap, "Vehicle", [0, 10], start_anim, anim_count)
+            for i in rider_sets:
+                for angles, start_anim, anim_count in sections:
+                    self.renderTask.add(angles, remap, "Riders %s" % i, [0, i, 10], start_anim, anim_count)
 
         return super(RenderVehicle, self).execute(context)
 
     def finished(self, context):
         super(RenderVehicle, self).finished(context)
-        self.report({'INFO'}, 'RCT Vehicle render finished.')
+        if not self.failed:
+            self.report({'INFO'}, 'RCT Vehicle render finished.')
 
 
 class SpriteTrackFlag(object):
@@ -178,6 +257,31 @@ class VehicleProperties(bpy.types.PropertyGroup):
                      "lay-down rollercoasters"),
         default=False)
 
+    number_of_animation_frames = bpy.props.IntProperty(
+        name="Animation Frames",
+        description="Number of animation frames to render. Animations start at frame 4, after the restraint animation",
+        default=1,
+        min=1)
+
+    number_of_rider_sets = bpy.props.IntProperty(
+        name="Rider Sets",
+        description=("Number of sets of riders to render. Each set of riders goes on its own scene layer, starting "
+                     "from layer 2 (the vehicle is on layer 1)"),
+        default=0,
+        min=0,
+        max=9)
+
+    use_rider_overlays = bpy.props.BoolProperty(
+        name="Render Riders Separately",
+        description=("Render the vehicle once for each angle, and each set of riders on its own, drawn over it "
+                     "afterwards. Much faster than rendering the whole vehicle again for every rider set, but needs "
+                     "Blender Render and the NumPy palettizer"),
+        default=True)
+
+    hasPrimaryColour = custom_properties.hasPrimaryColour
+    hasSecondaryColour = custom_properties.hasSecondaryColour
+    hasTernaryColour = custom_properties.hasTernaryColour
+
 
 class VehiclesPanel(bpy.types.Panel):
     bl_label = "RCT Vehicles"
@@ -216,6 +320,18 @@ class VehiclesPanel(bpy.types.Panel):
         row = layout.row()
         row.prop(properties, "inverted_set")
 
+        row = layout.row()
+        row.prop(properties, "hasPrimaryColour")
+        row.prop(properties, "hasSecondaryColour")
+        row.prop(properties, "hasTernaryColour")
+
+        row = layout.row()
+        row.prop(properties, "number_of_animation_frames")
+
+        row = layout.row()
+        row.prop(properties, "number_of_rider_sets")
+        row.prop(properties, "use_rider_overlays")
+
         row = layout.row()
         row.operator("render.rct_vehicle", text="Render Vehicle")
 
@@ -0,0 +1,139 @@
+'''
+Copyright (c) 2021 RCT Graphics Helper developers
+
+For a complete list of all authors, please refer to the addon's meta info.
+Interested in contributing? Visit https://github.com/oli414/Blender-RCT-Graphics
+
+RCT Graphics Helper is licensed under the GNU General Public License version 3.
+'''
+
+# `palettize` only depends on NumPy, so it is imported on its own here rather
+# than through the add-on package (which needs bpy).
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "rct_graphics_helper"))
+
+import palettize  # noqa: E402
+
+
+BLACK_WHITE = np.array([[0, 0, 0], [255, 255, 255]], dtype=np.float32)
+PRIMARIES = np.array([[0, 0, 0], [255, 255, 255], [255, 0, 0], [0, 255, 0], [0, 0, 255]], dtype=np.float32)
+
+
+@pytest.mark.parametrize("channels", [1, 2, 3, 4])
+def test_png_round_trip(tmp_path, channels):
+    image = np.random.RandomState(channels).randint(0, 256, (7, 5, channels)).astype(np.uint8)
+    path = str(tmp_path / "image.png")
+    palettize.write_png(path, image)
+    assert palettize.png_bit_depth(path) == 8
+    assert np.array_equal(palettize.read_png(path), image)
+
+
+def test_png_round_trip_greyscale_2d(tmp_path):
+    image = np.arange(12, dtype=np.uint8).reshape(3, 4)
+    path = str(tmp_path / "image.png")
+    palettize.write_png(path, image)
+    assert np.array_equal(palettize.read_png(path), image[:, :, None])
+
+
+def test_read_png_rejects_other_files(tmp_path):
+    path = tmp_path / "image.png"
+    path.write_bytes(b"not a png")
+    with pytest.raises(ValueError):
+        palettize.read_png(str(path))
+
+
+def test_bounding_boxes():
+    images = np.zeros((3, 8, 10), dtype=np.uint8)
+    images[0, 2:5, 3:7] = 10
+    images[1, 0, 9] = 1
+    boxes = palettize.bounding_boxes(images)
+    assert boxes.tolist() == [[2, 5, 3, 7], [0, 1, 9, 10], [0, 1, 0, 1]]
+
+
+def test_autocrop_matches_gmic():
+    # remap.gmic echoes {-1,xM}-{-2,xM}-128 for a 256x256 render, which is the
+    # crop's left edge minus 128: "-88,-28" for this image
+    images = np.zeros((1, 256, 256), dtype=np.uint8)
+    images[0, 100:120, 40:60] = 7
+    images[0, 110, 50] = 9
+    (cropped, offset), = palettize.autocrop(images)
+    assert offset == palettize.Offset(-88, -28)
+    assert cropped.shape == (20, 20)
+    assert cropped[10, 10] == 9
+
+
+def test_autocrop_empty_image():
+    images = np.zeros((1, 256, 256), dtype=np.uint8)
+    (cropped, offset), = palettize.autocrop(images)
+    assert cropped.shape == (1, 1)
+    assert offset == palettize.Offset(-128, -128)
+
+
+@pytest.mark.parametrize("method", palettize.DITHER_METHODS)
+def test_index_images_palette_colors(method):
+    # Colors that are already in the palette are never dithered away
+    images = np.broadcast_to(PRIMARIES[np.arange(20) % len(PRIMARIES)].reshape(1, 4, 5, 3), (2, 4, 5, 3))
+    indices = palettize.index_images(images, PRIMARIES, 0.5, method=method)
+    assert np.array_equal(indices, np.broadcast_to((np.arange(20) % len(PRIMARIES)).reshape(4, 5), (2, 4, 5)))
+
+
+@pytest.mark.parametrize("method", palettize.DITHER_METHODS)
+def test_index_images_without_dither(method):
+    images = np.array([[[[20, 10, 0], [240, 250, 230]], [[200, 30, 40], [10, 20, 220]]]], dtype=np.float32)
+    indices = palettize.index_images(images, PRIMARIES, 0, method=method)
+    assert indices.tolist() == [[[0, 1], [2, 4]]]
+
+
+@pytest.mark.parametrize("method", palettize.DITHER_METHODS)
+def test_index_images_dithers_grey(method):
+    # Mid grey between black and white comes out as an even mix of both
+    images = np.full((1, 16, 16, 3), 127.5, dtype=np.float32)
+    indices = palettize.index_images(images, BLACK_WHITE, 1.0, method=method)
+    assert set(np.unique(indices)) == {0, 1}
+    assert abs(indices.mean() - 0.5) < 0.1
+
+
+def test_index_images_ordered_pattern():
+    # Ordered dithering uses the same pattern in every frame, and tiles the Bayer matrix
+    images = np.full((2, 16, 16, 3), 100, dtype=np.float32)
+    indices = palettize.index_images(images, BLACK_WHITE, 1.0, method="ordered")
+    assert np.array_equal(indices[0], indices[1])
+    assert np.array_equal(indices[0, :8, :8], indices[0, 8:, 8:])
+
+
+def test_index_images_opaque_mask():
+    images = np.full((1, 4, 4, 3), 255, dtype=np.float32)
+    opaque = np.zeros((1, 4, 4), dtype=bool)
+    opaque[0, 1:3, 1:3] = True
+    for method in palettize.DITHER_METHODS:
+        indices = palettize.index_images(images, BLACK_WHITE, 0.5, opaque, method=method)
+        assert np.array_equal(indices[0], opaque[0].astype(int))
+
+
+@pytest.mark.parametrize("method", palettize.DITHER_METHODS)
+def test_index_images_lut(method):
+    images = np.random.RandomState(0).randint(0, 256, (2, 6, 6, 3)).astype(np.float32)
+    lut = palettize.build_lut(PRIMARIES)
+    on_palette = np.broadcast_to(PRIMARIES[[0, 1, 2, 3]].reshape(1, 2, 2, 3), (1, 2, 2, 3))
+    assert np.array_equal(palettize.index_images(on_palette, PRIMARIES, 0.5, lut=lut, method=method),
+                          [[[0, 1], [2, 3]]])
+    # Without dithering, the table gives the same entries as searching the palette, away from the boundaries
+    exact = palettize.index_images(images, PRIMARIES)
+    looked_up = palettize.index_images(images, PRIMARIES, lut=lut)
+    assert (exact == looked_up).mean() > 0.9
+
+
+def test_tile_labels_and_cut_tile():
+    images = np.arange(1, 17, dtype=np.uint8).reshape(1, 4, 4)
+    # The left tile is nearer, so it gets the column they share
+    columns = [[([(0, 0), (3, 0), (3, 4), (0, 4)], 1.0), ([(2, 0), (4, 0), (4, 4), (2, 4)], 2.0)]]
+    labels = palettize.tile_labels(columns, images.shape)
+    assert labels[0].tolist() == [[0, 0, 0, 1]] * 4
+    assert np.array_equal(palettize.cut_tile(images, labels, 1), np.where(labels == 1, images, 0))
+    assert palettize.cut_tile(images, labels, 1).dtype == np.uint8